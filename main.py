@@ -1,30 +1,131 @@
-from src.write_latex_tables import write_all_latex_tables
-from src.utils import get_all_data, read_nettskjema_data, read_participant_data
-from src.make_plots import plot_response_times_per_device
-from src.hypothesis_tests import run_withdrawal_wilcoxon_test
+import argparse
+
+from src.get_constants import override_constants
+
+TABLE_STAGES = [
+    "nettskjema_report", "shapiro_wilk", "mean_and_sd", "bootstrap", "website_statistics", "friedman", "wilcoxon",
+    "withdrawal",
+]
+STAGES = TABLE_STAGES + ["plots", "withdrawal_test"]
+DEFAULT_STAGES = TABLE_STAGES + ["withdrawal_test"]
+
+# Stages that need the data, and can not be run from the results store alone
+DATA_STAGES = ["nettskjema_report", "plots", "withdrawal_test"]
+
+PLOT_FORMATS = ["pdf", "png", "svg"]
+
+
+def parse_arguments(argv=None):
+    """
+    Parses the command line arguments.
+
+    Args:
+        argv (list of str or None): The arguments. If None, uses `sys.argv`.
+
+    Returns:
+        argparse.Namespace: The parsed arguments.
+    """
+    parser = argparse.ArgumentParser(
+        description="Processes the data, writes the LaTeX tables and plots, and runs the withdrawal test."
+    )
+    parser.add_argument(
+        "--stages", nargs="+", choices=STAGES, default=DEFAULT_STAGES,
+        help="The stages to run. Defaults to all the tables and the withdrawal test.",
+    )
+    parser.add_argument("--n-bootstraps", type=int, help="Bootstrap samples per test. Defaults to constants.yaml.")
+    parser.add_argument(
+        "--workers", type=int,
+        help="Worker processes for the bootstrap jobs and for reading the data. 0 uses all cores. Defaults to "
+        "constants.yaml.",
+    )
+    parser.add_argument(
+        "--table-workers", type=int,
+        help="Worker processes for writing the table families in parallel. 0 uses all cores. Defaults to "
+        "constants.yaml.",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        help="Folder for the cached data, like the processed data and the response cube. The stored results are kept "
+        "in the results folder from constants.yaml. Defaults to constants.yaml.",
+    )
+    parser.add_argument("--plot-format", choices=PLOT_FORMATS, help="File format of the plots. Defaults to pdf.")
+    parser.add_argument(
+        "--no-snapshot", action="store_true", help="Process the data again, instead of reading the cached snapshot."
+    )
+    parser.add_argument(
+        "--from-results", action="store_true",
+        help="Render the tables from the stored results, without reading the data.",
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="Write all the tables and plots, also the ones that are up to date."
+    )
+    args = parser.parse_args(argv)
+
+    if args.n_bootstraps is not None and args.n_bootstraps < 1:
+        parser.error("--n-bootstraps must be at least 1.")
+    if args.workers is not None and args.workers < 0:
+        parser.error("--workers can not be negative.")
+    if args.table_workers is not None and args.table_workers < 0:
+        parser.error("--table-workers can not be negative.")
+    if args.from_results:
+        data_stages = [stage for stage in args.stages if stage in DATA_STAGES]
+        if data_stages:
+            parser.error(f"The stages {data_stages} need the data, and can not be run with --from-results.")
+    return args
+
+
+def get_overrides_from_arguments(args):
+    """
+    Makes the overrides of `constants.yaml` from the command line arguments.
+
+    Args:
+        args (argparse.Namespace): The parsed arguments, from `parse_arguments()`.
+
+    Returns:
+        dict: The overrides, see `src.get_constants.override_constants()`.
+    """
+    overrides = {}
+    if args.n_bootstraps is not None:
+        overrides["n_bootstraps"] = args.n_bootstraps
+    if args.workers is not None:
+        overrides["n_workers"] = args.workers
+    if args.table_workers is not None:
+        overrides["n_table_workers"] = args.table_workers
+    if args.cache_dir is not None:
+        overrides.setdefault("paths", {}).setdefault("folders", {})["cache_folder"] = args.cache_dir
+    if args.plot_format is not None:
+        overrides.setdefault("paths", {})["filenames"] = {
+            f"answer_times_line_plot_{device}": f"answer_time_line_plot_{device}.{args.plot_format}"
+            for device in ["computer", "phone"]
+        }
+    return overrides
+
+
+def main(argv=None):
+    """
+    Runs the stages chosen on the command line. The data is read and processed once, and shared by all the stages.
+    Only the tables and plots that are out of date are written, see `src.pipeline.run_pipeline()`.
+
+    Args:
+        argv (list of str or None): The command line arguments. If None, uses `sys.argv`.
+    """
+    args = parse_arguments(argv)
+    override_constants(get_overrides_from_arguments(args))
+
+    # Imported after the overrides, since the paths and some constants are read when the modules are imported
+    from src.pipeline import run_pipeline
+    from src.utils import get_all_data
+
+    df = None if args.from_results else get_all_data(use_snapshot=not args.no_snapshot)
+    outputs = run_pipeline(df, [stage for stage in args.stages if stage != "withdrawal_test"], force=args.force)
+    print(f"Wrote {len(outputs['written'])} tables and plots, {len(outputs['skipped'])} were up to date.")
+
+    if "withdrawal_test" in args.stages:
+        from src.hypothesis_tests import run_withdrawal_wilcoxon_test
+        withdrawal_test_result = run_withdrawal_wilcoxon_test(df)
+        print(f"The results from the Wilcoxon withdrawal test was stat: {withdrawal_test_result['stat']:.8f}")
+        print(f"With p-value {withdrawal_test_result['p_value']:.8f}.")
 
 
 if __name__ == "__main__":
-    run_plots = False
-    nettskjema_df = read_nettskjema_data()
-    experiments_df = read_participant_data()
-    df = get_all_data()
-    write_all_latex_tables(
-        df,
-        nettskjema_report=True,
-        shapiro_wilk=True,
-        mean_and_sd=True,
-        bootstrap=False,
-        website_statistics=True,
-        friedman=True,
-        wilcoxon=True,
-        withdrawal=True,
-    )
-
-    if run_plots:
-        plot_response_times_per_device(df, "computer")
-        plot_response_times_per_device(df, "phone")
-
-    withdrawal_test_result = run_withdrawal_wilcoxon_test(df)
-    print(f"The results from the Wilcoxon withdrawal test was stat: {withdrawal_test_result['stat']:.8f}")
-    print(f"With p-value {withdrawal_test_result['p_value']:.8f}.")
+    main()
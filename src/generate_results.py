@@ -1,10 +1,17 @@
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
 import pandas as pd
 
 from src.get_constants import get_constants
-from src.hypothesis_tests import (get_means_and_sd, run_bootstrap_test, run_device_wilcoxon_tests, run_friedman_test,
-                                  run_group_test, run_grouped_shapiro_wilk_normality_test, run_pairwise_wilcoxon_tests)
+from src.group_index import get_group_views
+from src.hypothesis_tests import (get_batched_means_and_sds, run_batched_shapiro_wilk_normality_test,
+                                  run_bootstrap_test, run_device_wilcoxon_tests, run_friedman_test, run_group_test,
+                                  run_pairwise_wilcoxon_tests, run_shared_bootstrap_test, run_shared_permutation_test)
 from src.process_data import _quantisize_answers
+from src.response_cube import get_dataframe_cube
+from src.results_cache import cache_results
+from src.utils import get_n_workers
 
 CONSTANTS = get_constants()
 WEBSITES = CONSTANTS["websites"]
@@ -40,13 +47,60 @@ def get_website_averages(df):
     print(f"{len(df)=}")
 
 
-def get_all_group_test_results(df, test_type="mannwhitney"):
+def _run_job(job):
+    """
+    Runs one test job. Defined at module level so that it can be sent to worker processes.
+
+    Args:
+        job (tuple): Tuple of the test function and a dict with the keyword arguments to call it with.
+
+    Returns:
+        dict: The test results.
+    """
+    function, kwargs = job
+    return function(**kwargs)
+
+
+def _run_jobs(jobs, n_workers=None):
+    """
+    Runs independent test jobs, either serially or spread over a pool of worker processes.
+
+    Each random job should have its own `random_state`, so that the results do not depend on the number of workers.
+
+    Args:
+        jobs (list of tuple): Tuples of the test function and a dict with the keyword arguments to call it with.
+        n_workers (int or None): The number of worker processes. See `src.utils.get_n_workers()`.
+
+    Returns:
+        list of dict: The test results, in the same order as `jobs`.
+    """
+    n_workers = min(get_n_workers(n_workers), len(jobs))
+    if n_workers <= 1:
+        return [_run_job(job) for job in jobs]
+
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        return list(executor.map(_run_job, jobs))
+
+
+@cache_results(ignore=("n_workers", "group_index"))
+def get_all_group_test_results(df, test_type="mannwhitney", n_workers=None, shared_resamples=False, group_index=None):
     """
     Run grouped tests for all the groups and test statistics of interest.
 
+    The bootstrap tests for each test variable and grouping are independent, and can be run in parallel. Every test
+    gets its own child seed spawned from `CONSTANTS["random_state"]`, so the results are identical for any number of
+    workers. The permutation tests run all test variables of a grouping in one job.
+
     Args:
         df (pd.Dataframe): All the data.
-        test_type (str): In ["mean-sd", "shapiro-wilk", "t-test", "mannwhitney", "bootstrap"].
+        test_type (str): In ["mean-sd", "shapiro-wilk", "t-test", "mannwhitney", "permutation", "bootstrap"].
+        n_workers (int or None): The number of worker processes for the bootstrap and permutation tests. If None, uses
+            `CONSTANTS["n_workers"]`.
+        shared_resamples (bool): If True, the bootstrap draws one set of resampled rows per grouping and uses it for
+            all the test variables, see `run_shared_bootstrap_test()`. Then there is one seed per grouping instead of
+            one per test.
+        group_index (dict or None): Precompiled groupings from `src.group_index.compile_group_index(df)`. If None,
+            they are compiled from `df`.
 
     Returns:
         dict: Dict of all the results.
@@ -56,61 +110,8 @@ def get_all_group_test_results(df, test_type="mannwhitney"):
     if test_type not in test_types:
         raise ValueError(f"Test type must be in {test_types}. Was {test_type}. ")
 
-    # Group the data based on all the groups we want to use
-    privacy_concern = {
-        "df1": df[df["privacy_concern"] != "Slightly concerned"],
-        "df2": df[df["privacy_concern"] == "Slightly concerned"],
-        "group_names": ["Q1. Quite or very concerned about privacy", "Q1. Slightly concerned about privacy"],
-        "grouping_name": "Quite or very concerned about privacy",
-    }
-    understand_cookie_consent = {
-        "df1": df[~df["understand_cookie_consent"].isin(["To a great extent", "To some extent"])],
-        "df2": df[~df["understand_cookie_consent"].isin(["Not at all", "To a small extent", "Neither nor"])],
-        "group_names": [
-            "Q4. Understand cookie consent to some or more extent", "Q4. Do not understand cookie consent well"
-        ],
-        "grouping_name": "Understands cookie consent",
-    }
-    cookie_banner_response = {
-        "df1": df[df["cookie_banner_response"] == "I actively take steps to withhold my consent."],
-        "df2": df[df["cookie_banner_response"] != "I akictively take steps to withhold my consent."],
-        "group_names": ["Q7. Actively withholds consent", "Q7. Does not actively withhold consent"],
-        "grouping_name": "Actively withholds consent",
-    }
-    have_withdrawn_consent = {
-        "df1": df[df["have_withdrawn_consent"] == "Yes"],
-        "df2": df[df["have_withdrawn_consent"] == "No"],
-        "group_names": ["Q8. Have withdrawn consent", "Q8. Have not withdrawn consent"],
-        "grouping_name": "Have withdrawn consent",
-    }
-    aware_withdrawal_ease = {
-        "df1": df[df["aware_withdrawal_ease"] == "Yes"],
-        "df2": df[df["aware_withdrawal_ease"] == "No"],
-        "group_names": ["Q9. Aware of withdrawal ease", "Q9. Not aware of withdrawal ease"],
-        "grouping_name": "Aware of withdrawal ease",
-    }
-    age = {
-        "df1": df[df["age_int"] < 30],
-        "df2": df[df["age_int"] > 30],
-        "group_names": ["Q11. Under 30 years", "Q11. 30 years or older"],
-        "grouping_name": "Age",
-    }
-    it_background = {
-        "df1": df[df["it_background"] != "No"],
-        "df2": df[df["it_background"] == "No"],
-        "group_names": ["Q12. With IT background", "Q12. Without IT background"],
-        "grouping_name": "IT background",
-    }
-
-    groups = [
-        privacy_concern,
-        understand_cookie_consent,
-        cookie_banner_response,
-        have_withdrawn_consent,
-        aware_withdrawal_ease,
-        age,
-        it_background,
-    ]
+    # Group the data based on all the groups we want to use, as views instead of copies of the dataframe
+    groups = get_group_views(df, group_index=group_index)
 
     test_variables = [
         "cookie_questions_score",
@@ -130,31 +131,92 @@ def get_all_group_test_results(df, test_type="mannwhitney"):
         }
         groups.insert(0, full_group)
 
+        # All the groups and test variables at once, with one row in the membership matrix per (sub)group
+        memberships = np.zeros((2 * len(groups) - 1, len(df)), dtype=bool)
+        memberships[0] = True
+        for i, group in enumerate(groups[1:]):
+            memberships[2 * i + 1, group["df1"].rows] = True
+            memberships[2 * i + 2, group["df2"].rows] = True
+        group_sizes = memberships.sum(axis=1)
+        means, sds = get_batched_means_and_sds(df[test_variables].to_numpy(dtype=float), memberships)
+
+    if test_type == "bootstrap" and shared_resamples:
+        jobs = [
+            (run_shared_bootstrap_test, {
+                "group_df1": group["df1"][test_variables],
+                "group_df2": group["df2"][test_variables],
+                "value_columns": test_variables,
+                "group_names": group["group_names"],
+            })
+            for group in groups
+        ]
+    elif test_type == "bootstrap":
+        jobs = [
+            (run_bootstrap_test, {
+                "group_df1": group["df1"][[test_variable]],
+                "group_df2": group["df2"][[test_variable]],
+                "value_column": test_variable,
+                "group_names": group["group_names"],
+            })
+            for test_variable in test_variables for group in groups
+        ]
+    elif test_type == "permutation":  # All test variables share the group splits, one job per grouping
+        jobs = [
+            (run_shared_permutation_test, {
+                "group_df1": group["df1"][test_variables],
+                "group_df2": group["df2"][test_variables],
+                "value_columns": test_variables,
+                "group_names": group["group_names"],
+            })
+            for group in groups
+        ]
+
+    if test_type in ["bootstrap", "permutation"]:
+        seeds = np.random.SeedSequence(CONSTANTS["random_state"]).spawn(len(jobs))
+        for (_, kwargs), seed in zip(jobs, seeds):
+            kwargs["random_state"] = seed
+        job_results = _run_jobs(jobs, n_workers=n_workers)
+        if shared_resamples or test_type == "permutation":
+            shared_results = dict(zip([group["grouping_name"] for group in groups], job_results))
+        else:
+            bootstrap_results = iter(job_results)
+
+    if test_type == "shapiro-wilk":  # Test all the subgroups in one batch
+        samples = [
+            group[group_df][test_variable]
+            for test_variable in test_variables for group in groups for group_df in ["df1", "df2"]
+        ]
+        normality_results = iter(run_batched_shapiro_wilk_normality_test(samples))
+
     all_results = {}
     for test_variable in test_variables:
         test_variable_results = {}
 
-        for group in groups:
-            if group["grouping_name"] == "Full Dataset":  # Special case for full dataset
+        for i, group in enumerate(groups):
+            if test_type == "mean-sd":  # Row 0 in the membership matrix is the full dataset, then two rows per group
+                group_rows = [0] if group["grouping_name"] == "Full Dataset" else [2 * i - 1, 2 * i]
+                variable_index = test_variables.index(test_variable)
                 result = {
                     "test_variable": test_variable,
                     "group_names": group["group_names"],
-                    "group_sizes": [len(group["df"])],
-                    "group_means": [group["df"][test_variable].mean()],
-                    "group_sds": [group["df"][test_variable].std()],
+                    "group_sizes": [int(group_sizes[row]) for row in group_rows],
+                    "group_means": [float(means[row, variable_index]) for row in group_rows],
+                    "group_sds": [float(sds[row, variable_index]) for row in group_rows],
                 }
-            elif test_type == "mean-sd":
-                result = get_means_and_sd(
-                    group["df1"], group["df2"], value_column=test_variable, group_names=group["group_names"]
-                )
             elif test_type == "shapiro-wilk":
-                result = run_grouped_shapiro_wilk_normality_test(
-                    group["df1"], group["df2"], value_column=test_variable, group_names=group["group_names"]
-                )
+                result = {
+                    "test_variable": test_variable,
+                    "group_names": group["group_names"],
+                    "group_sizes": [len(group["df1"]), len(group["df2"])],
+                    "normality": {
+                        str(group["group_names"][0]): next(normality_results),
+                        str(group["group_names"][1]): next(normality_results),
+                    },
+                }
+            elif (test_type == "bootstrap" and shared_resamples) or test_type == "permutation":
+                result = shared_results[group["grouping_name"]][test_variable]
             elif test_type == "bootstrap":
-                result = run_bootstrap_test(
-                    group["df1"], group["df2"], value_column=test_variable, group_names=group["group_names"],
-                )
+                result = next(bootstrap_results)
             else:
                 result = run_group_test(
                     group["df1"], group["df2"], value_column=test_variable, test_type=test_type,
@@ -168,6 +230,7 @@ def get_all_group_test_results(df, test_type="mannwhitney"):
     return all_results
 
 
+@cache_results()
 def get_website_statistics(df, perform_wilcoxon_test=False):
     """
     Collects high level website data from the dataframe and returns as a dictionary.
@@ -183,76 +246,76 @@ def get_website_statistics(df, perform_wilcoxon_test=False):
     Returns:
         dict: Dict of all the results.
     """
-    results = {}
-
-    # Calculate stats for all individual websites
-    for website in WEBSITES:
-        results[website] = {}
-        for device in DEVICES:
-            results[website][f"{device}_accepts"] = df[f"{device}.{website}.answer.int"].sum()
-            results[website][f"{device}_accepts_std"] = df[f"{device}.{website}.answer.int"].std()
-            results[website][f"{device}_time"] = df[f"{device}.{website}.time"].mean()
-            results[website][f"{device}_time_std"] = df[f"{device}.{website}.time"].std()
-
-        # Add results for both devices
-        results[website]["total_accepts"] = df[f"{website}_accepts_int"].sum()
-        results[website]["total_accepts_std"] = df[f"{website}_accepts_int"].std()
-        results[website]["total_time"] = df[f"{website}_average_time"].mean()
-        results[website]["total_time_std"] = df[f"{website}_average_time"].std()
-
-    all_stats = {}  # Aggregates all websites
-    all_df = {}  # For Wilcoxon tests
+    return get_website_statistics_from_cube(get_dataframe_cube(df), perform_wilcoxon_test=perform_wilcoxon_test)
 
-    for device in DEVICES:
-        all_accepts = pd.concat([df[f"{device}.{website}.answer.int"] for website in WEBSITES])
-        all_times = pd.concat([df[f"{device}.{website}.time"] for website in WEBSITES])
-        all_df[f"{device}_accepts"] = all_accepts
-        all_df[f"{device}_time"] = all_times
-
-        all_stats[f"{device}_accepts"] = all_accepts.sum()
-        all_stats[f"{device}_accepts_std"] = all_accepts.std()
-        all_stats[f"{device}_time"] = all_times.mean()
-        all_stats[f"{device}_time_std"] = all_times.std()
 
-    all_df = pd.DataFrame(all_df)
+def get_website_statistics_from_cube(cube, perform_wilcoxon_test=False):
+    """
+    Same as `get_website_statistics()`, but from a response cube, for instance a memory-mapped one from
+    `src.utils.get_response_cube()`. The statistics are reduced over the participants in chunks.
 
-    # Calculate both devices for all websites aggregated
-    all_accepts = pd.concat([df[f"{website}_accepts_int"] for website in WEBSITES])
-    all_times = pd.concat([df[f"{website}_average_time"] for website in WEBSITES])
+    Args:
+        cube (ResponseCube): The responses.
+        perform_wilcoxon_test (bool): If True, will perform wilcoxon signed ranked test on each website. Needs the
+            accepts and times of all participants in memory.
 
-    all_stats["total_accepts"] = all_accepts.sum()
-    all_stats["total_accepts_std"] = all_accepts.std()
-    all_stats["total_time"] = all_times.mean()
-    all_stats["total_time_std"] = all_times.std()
+    Returns:
+        dict: Dict of all the results.
+    """
+    # Statistics over the participants for each website, and over the participants and websites for "all".
+    # "both" is the sum over the devices, like the "{website}_accepts_int" and "{website}_average_time" columns.
+    statistics = {}
+    for device in [*DEVICES, "both"]:
+        device_name = "total" if device == "both" else device
+        reductions = {
+            "accepts": ("sum", "accepts"),
+            "accepts_std": ("std", "accepts"),
+            "time": ("mean", "time"),
+            "time_std": ("std", "time"),
+        }
+        statistics[device_name] = {
+            name: np.concatenate([
+                cube.reduce(statistic, variable, device), cube.reduce(statistic, variable, device, all_websites=True)
+            ])
+            for name, (statistic, variable) in reductions.items()
+        }
+        # Like the sums of the accept columns, the sums are ints, unless some answers are missing, which makes the
+        # columns floats
+        counts = np.concatenate([
+            cube.reduce("count", "accepts", device), cube.reduce("count", "accepts", device, all_websites=True)
+        ])
+        n_values = [len(cube)] * len(WEBSITES) + [len(cube) * len(WEBSITES)]
+        statistics[device_name]["accepts"] = [
+            np.int64(accepts) if count == n else np.float64(accepts)
+            for accepts, count, n in zip(statistics[device_name]["accepts"], counts, n_values)
+        ]
 
-    results["all"] = all_stats
+    results = {}
+    for i, website in enumerate([*WEBSITES, "all"]):
+        results[website] = {}
+        for device_name in [*DEVICES, "total"]:
+            for statistic, values in statistics[device_name].items():
+                results[website][f"{device_name}_{statistic}"] = values[i]
 
     if perform_wilcoxon_test:  # Run Wilcoxon signed ranked test on accepts and time given different devices.
-        for website in WEBSITES:
-            test_results_accepts = run_device_wilcoxon_tests(
-                df, column_name1=f"computer.{website}.answer.int", column_name2=f"phone.{website}.answer.int"
+        accepts = {device: cube.get_values("accepts", device) for device in DEVICES}
+        times = {device: cube.get_values("time", device) for device in DEVICES}
+        for i, website in enumerate([*WEBSITES, "all"]):
+            device_df = pd.DataFrame({  # For "all", the websites are put after each other
+                f"{device}_{variable}": values[device][i] if website != "all" else values[device].reshape(-1)
+                for device in DEVICES for variable, values in [("accepts", accepts), ("time", times)]
+            })
+            results[website]["test_statistics_accepts"] = run_device_wilcoxon_tests(
+                device_df, column_name1="computer_accepts", column_name2="phone_accepts"
             )
-            results[website]["test_statistics_accepts"] = test_results_accepts
-
-            test_results_time = run_device_wilcoxon_tests(
-                df, column_name1=f"computer.{website}.time", column_name2=f"phone.{website}.time"
+            results[website]["test_statistics_time"] = run_device_wilcoxon_tests(
+                device_df, column_name1="computer_time", column_name2="phone_time"
             )
-            results[website]["test_statistics_time"] = test_results_time
-
-        # Also run tests for the all website aggregation
-        test_results_accepts = run_device_wilcoxon_tests(
-            all_df, column_name1="computer_accepts", column_name2="phone_accepts"
-        )
-        results["all"]["test_statistics_accepts"] = test_results_accepts
-
-        test_results_time = run_device_wilcoxon_tests(
-            all_df, column_name1="computer_time", column_name2="phone_time"
-        )
-        results["all"]["test_statistics_time"] = test_results_time
 
     return results
 
 
+@cache_results()
 def get_all_friedman_test_results(df):
     """
     Runs Friedman test with all testing configurations, meaning both the accepts and time as test variables,
@@ -264,15 +327,17 @@ def get_all_friedman_test_results(df):
     Returns:
         dict: Dict of all the results.
     """
+    cube = get_dataframe_cube(df)
     all_results = {"accepts": {}, "time": {}}
     for test_variable in ["accepts", "time"]:
         for device in ["computer", "phone", "both"]:
-            results = run_friedman_test(df, test_variable=test_variable, device=device)
+            results = run_friedman_test(df, test_variable=test_variable, device=device, cube=cube)
             all_results[test_variable][device] = results
 
     return all_results
 
 
+@cache_results()
 def get_all_wilcoxon_test_results(df):
     """
     Runs Wilcoxon test with all testing configurations, meaning both the accepts and time as test variables,
@@ -285,15 +350,17 @@ def get_all_wilcoxon_test_results(df):
     Returns:
         dict: Dict of all the results.
     """
+    cube = get_dataframe_cube(df)
     all_results = {"accepts": {}, "time": {}}
     for test_variable in ["accepts", "time"]:
         for device in ["computer", "phone", "both"]:
-            results = run_pairwise_wilcoxon_tests(df, test_variable=test_variable, device=device)
+            results = run_pairwise_wilcoxon_tests(df, test_variable=test_variable, device=device, cube=cube)
             all_results[test_variable][device] = results
 
     return all_results
 
 
+@cache_results()
 def get_withdrawal_and_answer_times(df):
     """
     Computes average cookie banner response times, withdrawal times, and group sizes for all devices and websites,
@@ -305,54 +372,53 @@ def get_withdrawal_and_answer_times(df):
     Returns:
         dict: Nested dictionary with statistics for each website and device, plus 'all'.
     """
-    result = {}
-    all_websites = {}
-
-    for device in DEVICES:
-        result[device] = {}
-        all_websites[device] = {
-            "avg_answer_all": 0,
-            "avg_answer_no_withdraw": 0,
-            "avg_withdraw": 0,
-            "n_withdraw": 0,
-            "n_answers": 0,
-        }
+    return get_withdrawal_and_answer_times_from_cube(get_dataframe_cube(df))
 
-        for website in WEBSITES:
-            withdraw_column = f"Withdraw.{device}.{website}.time"
 
-            answer_times = df[df[f"{device}.{website}.answer.int"] == 1][f"{device}.{website}.time"]
-            if withdraw_column in df.columns:
-                withdraw_times = df[withdraw_column]
-            else:
-                withdraw_times = pd.Series(dtype=float)  # No withdraws for this device and website
+def get_withdrawal_and_answer_times_from_cube(cube):
+    """
+    Same as `get_withdrawal_and_answer_times()`, but from a response cube, for instance a memory-mapped one from
+    `src.utils.get_response_cube()`. The statistics are reduced over the participants in chunks.
 
-            withdraw_times = withdraw_times.reindex(answer_times.index)
+    Args:
+        cube (ResponseCube): The responses.
 
-            avg_answer_all = answer_times.mean()
-            avg_withdraw = withdraw_times.mean()
-            n_withdraw = withdraw_times.notna().sum()
-            n_answer_all = len(answer_times)
+    Returns:
+        dict: Nested dictionary with statistics for each website and device, plus 'all'.
+    """
+    # Only the times where consent was given, with shape (devices, websites)
+    avg_answer_all = np.stack([cube.reduce("mean", "time", device, consented_only=True) for device in DEVICES])
+    avg_withdraw = np.stack([
+        cube.reduce("mean", "withdrawal_time", device, consented_only=True) for device in DEVICES
+    ])
+    n_withdraw = np.stack([
+        cube.reduce("count", "withdrawal_time", device, consented_only=True) for device in DEVICES
+    ])
+    n_answers = np.stack([cube.reduce("count", "accepts", device, consented_only=True) for device in DEVICES])
 
+    result = {}
+    for i, device in enumerate(DEVICES):
+        result[device] = {}
+        for j, website in enumerate(WEBSITES):
             result[device][website] = {
-                "avg_answer_all": avg_answer_all,
-                "avg_withdraw": avg_withdraw,
-                "n_withdraw": n_withdraw,
-                "n_answers": n_answer_all,
+                "avg_answer_all": avg_answer_all[i, j],
+                "avg_withdraw": avg_withdraw[i, j],
+                "n_withdraw": n_withdraw[i, j],
+                "n_answers": int(n_answers[i, j]),
             }
 
-            # Aggregate websites
-            all_websites[device]["avg_answer_all"] += avg_answer_all / len(WEBSITES)
-            if n_withdraw > 0:
-                all_websites[device]["avg_withdraw"] += avg_withdraw / len(WEBSITES)
-            all_websites[device]["n_withdraw"] += n_withdraw
-            all_websites[device]["n_answers"] += n_answer_all
-
-        result[device]["all"] = all_websites[device]
+        # Aggregate websites. avg_withdraw is nan if there are no withdraws, so those are not added.
+        result[device]["all"] = {
+            "avg_answer_all": (avg_answer_all[i] / len(WEBSITES)).sum(),
+            "avg_answer_no_withdraw": 0,
+            "avg_withdraw": np.where(n_withdraw[i] > 0, avg_withdraw[i] / len(WEBSITES), 0).sum(),
+            "n_withdraw": n_withdraw[i].sum(),
+            "n_answers": int(n_answers[i].sum()),
+        }
 
     # Combine devices "computer" and "phone" to get "both"
     result["both"] = {}
-    for website in WEBSITES + ["all"]:
+    for website in [*WEBSITES, "all"]:
         result_phone = result["phone"][website]
         result_computer = result["computer"][website]
         result["both"][website] = {
@@ -1,5 +1,19 @@
-import yaml
+import json
+import os
+from collections.abc import Mapping
 from pathlib import Path
+from types import MappingProxyType
+
+import yaml
+
+# The folder with `constants.yaml`. The relative paths in the constants are relative to this folder.
+PROJECT_ROOT = Path(__file__).absolute().parent.parent
+CONSTANTS_PATH = PROJECT_ROOT / "constants.yaml"
+
+# The overrides are kept in an environment variable, so that worker processes started with "spawn" get them as well
+OVERRIDES_ENVIRONMENT_VARIABLE = "COOKIE_BANNER_CONSTANTS_OVERRIDES"
+
+_loaded_constants = None
 
 
 def read_yaml(file_path):
@@ -24,11 +38,112 @@ def read_yaml(file_path):
     return constants
 
 
+def _freeze(value):
+    """
+    Makes the constants read-only, with the dicts as read-only mappings and the lists as tuples.
+    """
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(inner_value) for key, inner_value in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(inner_value) for inner_value in value)
+    return value
+
+
+def _merge_overrides(constants, overrides, prefix=""):
+    """
+    Returns a copy of `constants` with the values in `overrides` replaced. Nested dicts are merged, so only the given
+    keys are changed.
+
+    Raises:
+        KeyError: If a key in `overrides` is not in `constants`.
+    """
+    merged = dict(constants)
+    for key, value in overrides.items():
+        if key not in constants:
+            raise KeyError(f"Can not override {prefix}{key}, it is not in {CONSTANTS_PATH.name}. ")
+        if isinstance(value, dict) and isinstance(constants[key], dict):
+            merged[key] = _merge_overrides(constants[key], value, prefix=f"{prefix}{key}.")
+        else:
+            merged[key] = value
+    return merged
+
+
+def get_constant_overrides():
+    """
+    Returns the overrides set with `override_constants()`.
+
+    Returns:
+        dict: The overrides, empty if there are none.
+    """
+    return json.loads(os.environ.get(OVERRIDES_ENVIRONMENT_VARIABLE, "{}"))
+
+
+def override_constants(overrides):
+    """
+    Overrides some of the constants from `constants.yaml` for this run, and for the worker processes started by it.
+    Nested dicts are merged into the constants, so `{"paths": {"folders": {"cache_folder": "other_cache"}}}` only
+    changes the cache folder.
+
+    The overrides replace the ones from earlier calls, so calling this with `{}` goes back to `constants.yaml`. To
+    add to the current overrides, pass `{**get_constant_overrides(), ...}`.
+
+    Constants the modules read when they are imported, like the websites and the paths, only change for modules that
+    are imported after this is called.
+
+    Args:
+        overrides (dict): The constants to change. Must be JSON serializable.
+
+    Raises:
+        KeyError: If a key in `overrides` is not in `constants.yaml`.
+    """
+    global _loaded_constants
+    _merge_overrides(read_yaml(CONSTANTS_PATH), overrides)  # Raises if a key does not exist
+    os.environ[OVERRIDES_ENVIRONMENT_VARIABLE] = json.dumps(overrides)
+    _loaded_constants = None
+
+
+def _load_constants():
+    """
+    Reads `constants.yaml` and applies the overrides, the first time it is called after start or after the overrides
+    changed.
+    """
+    global _loaded_constants
+    if _loaded_constants is None:
+        constants = _merge_overrides(read_yaml(CONSTANTS_PATH), get_constant_overrides())
+        _loaded_constants = _freeze(constants)
+    return _loaded_constants
+
+
+class Constants(Mapping):
+    """
+    Read-only view of the constants from `constants.yaml`, with the overrides from `override_constants()`.
+
+    The file is not read before a constant is used, and then only once. Nested dicts are read-only mappings and
+    lists are tuples, so the constants can not be changed by accident.
+    """
+
+    def __getitem__(self, key):
+        return _load_constants()[key]
+
+    def __iter__(self):
+        return iter(_load_constants())
+
+    def __len__(self):
+        return len(_load_constants())
+
+    def __repr__(self):
+        return f"Constants({dict(_load_constants())})"
+
+
+_CONSTANTS = Constants()
+
+
 def get_constants():
     """
-    Reads and returns the constants.yaml file.
+    Returns the constants from `constants.yaml`. The same object is returned every time, and the file is only read
+    once, the first time a constant is used.
 
     Returns:
-        dict: Dictionary of the constants from `constants.yaml`.
+        Constants: Read-only mapping of the constants from `constants.yaml`.
     """
-    return read_yaml("constants.yaml")
+    return _CONSTANTS
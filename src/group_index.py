@@ -0,0 +1,144 @@
+import numpy as np
+
+
+class GroupView:
+    """
+    A group of rows in a dataframe, stored as row positions instead of a copy of the rows.
+
+    Indexing with a column name (or a list of column names) returns only those columns for the rows in the group, so
+    it can be passed to the test functions in place of a filtered dataframe.
+    """
+
+    def __init__(self, df, rows):
+        """
+        Args:
+            df (pd.DataFrame): The full dataframe.
+            rows (np.ndarray): The positions of the rows in the group.
+        """
+        self.df = df
+        self.rows = rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, columns):
+        return self.df[columns].iloc[self.rows]
+
+
+def _get_grouping_masks(df):
+    """
+    Returns the groupings used in the group tests, with boolean masks over the rows of the dataframe for the two
+    groups.
+
+    Args:
+        df (pd.DataFrame): All the data.
+
+    Returns:
+        list of dict: The groupings, with masks, group names and grouping names.
+    """
+    privacy_concern = {
+        "mask1": df["privacy_concern"] != "Slightly concerned",
+        "mask2": df["privacy_concern"] == "Slightly concerned",
+        "group_names": ["Q1. Quite or very concerned about privacy", "Q1. Slightly concerned about privacy"],
+        "grouping_name": "Quite or very concerned about privacy",
+    }
+    understand_cookie_consent = {
+        "mask1": ~df["understand_cookie_consent"].isin(["To a great extent", "To some extent"]),
+        "mask2": ~df["understand_cookie_consent"].isin(["Not at all", "To a small extent", "Neither nor"]),
+        "group_names": [
+            "Q4. Understand cookie consent to some or more extent", "Q4. Do not understand cookie consent well"
+        ],
+        "grouping_name": "Understands cookie consent",
+    }
+    cookie_banner_response = {
+        "mask1": df["cookie_banner_response"] == "I actively take steps to withhold my consent.",
+        "mask2": df["cookie_banner_response"] != "I akictively take steps to withhold my consent.",
+        "group_names": ["Q7. Actively withholds consent", "Q7. Does not actively withhold consent"],
+        "grouping_name": "Actively withholds consent",
+    }
+    have_withdrawn_consent = {
+        "mask1": df["have_withdrawn_consent"] == "Yes",
+        "mask2": df["have_withdrawn_consent"] == "No",
+        "group_names": ["Q8. Have withdrawn consent", "Q8. Have not withdrawn consent"],
+        "grouping_name": "Have withdrawn consent",
+    }
+    aware_withdrawal_ease = {
+        "mask1": df["aware_withdrawal_ease"] == "Yes",
+        "mask2": df["aware_withdrawal_ease"] == "No",
+        "group_names": ["Q9. Aware of withdrawal ease", "Q9. Not aware of withdrawal ease"],
+        "grouping_name": "Aware of withdrawal ease",
+    }
+    age = {
+        "mask1": df["age_int"] < 30,
+        "mask2": df["age_int"] > 30,
+        "group_names": ["Q11. Under 30 years", "Q11. 30 years or older"],
+        "grouping_name": "Age",
+    }
+    it_background = {
+        "mask1": df["it_background"] != "No",
+        "mask2": df["it_background"] == "No",
+        "group_names": ["Q12. With IT background", "Q12. Without IT background"],
+        "grouping_name": "IT background",
+    }
+
+    return [
+        privacy_concern,
+        understand_cookie_consent,
+        cookie_banner_response,
+        have_withdrawn_consent,
+        aware_withdrawal_ease,
+        age,
+        it_background,
+    ]
+
+
+def compile_group_index(df):
+    """
+    Compiles the groupings used in the group tests into row positions over the dataframe. This is done once, and
+    the groups can then be looked up as `GroupView`s without copying the dataframe.
+
+    Args:
+        df (pd.DataFrame): All the data.
+
+    Returns:
+        dict: Dict with the number of rows and a list of the groupings. Each grouping has the row positions of the two
+            groups ("rows1" and "rows2"), the group names and the grouping name.
+    """
+    groupings = []
+    for grouping in _get_grouping_masks(df):
+        groupings.append({
+            "rows1": np.flatnonzero(grouping["mask1"].to_numpy(dtype=bool)),
+            "rows2": np.flatnonzero(grouping["mask2"].to_numpy(dtype=bool)),
+            "group_names": grouping["group_names"],
+            "grouping_name": grouping["grouping_name"],
+        })
+
+    return {"n_rows": len(df), "groupings": groupings}
+
+
+def get_group_views(df, group_index=None):
+    """
+    Returns the groupings as dicts with a `GroupView` for each of the two groups, on the format used by
+    `src.generate_results.get_all_group_test_results()`.
+
+    Args:
+        df (pd.DataFrame): All the data.
+        group_index (dict or None): Index from `compile_group_index()`. If None, compiles it from `df`.
+
+    Returns:
+        list of dict: The groupings, with "df1", "df2", "group_names" and "grouping_name".
+    """
+    if group_index is None:
+        group_index = compile_group_index(df)
+    if group_index["n_rows"] != len(df):
+        raise ValueError(f"Group index is for {group_index['n_rows']} rows, but the dataframe has {len(df)}. ")
+
+    return [
+        {
+            "df1": GroupView(df, grouping["rows1"]),
+            "df2": GroupView(df, grouping["rows2"]),
+            "group_names": grouping["group_names"],
+            "grouping_name": grouping["grouping_name"],
+        }
+        for grouping in group_index["groupings"]
+    ]
@@ -1,9 +1,12 @@
-from itertools import combinations
+from functools import lru_cache
+from itertools import combinations, islice
+from math import comb
 
 import numpy as np
-from scipy.stats import friedmanchisquare, mannwhitneyu, shapiro, ttest_ind, wilcoxon
 
 from src.get_constants import get_constants
+from src.null_distributions import run_exact_mann_whitney_u_test, run_wilcoxon_test
+from src.response_cube import get_dataframe_cube, nanmean, nanstd
 
 CONSTANTS = get_constants()
 WEBSITES = CONSTANTS["websites"]
@@ -40,6 +43,179 @@ def get_means_and_sd(group_df1, group_df2, value_column, group_names):
     return result
 
 
+def get_batched_means_and_sds(values, memberships):
+    """
+    Finds the means and sd's of many groups and variables at once. For each group, all the variables are reduced
+    together, with the same steps as pandas. Missing values are skipped, like in pandas.
+
+    Args:
+        values (np.ndarray): Array of shape (n_rows, n_variables) with the values of the test variables.
+        memberships (np.ndarray): Boolean array of shape (n_groups, n_rows), True where a row is in a group.
+
+    Returns:
+        (np.ndarray, np.ndarray): The means and sd's, both of shape (n_groups, n_variables). Exactly the same as
+            `pd.Series.mean()` and `pd.Series.std()` of each group and variable, and NaN where a group has too few
+            (non-missing) values.
+    """
+    values_by_variable = np.asarray(values, dtype=float).T
+    memberships = np.asarray(memberships, dtype=bool)
+
+    means = np.empty((len(memberships), len(values_by_variable)))
+    sds = np.empty_like(means)
+    for i, membership in enumerate(memberships):
+        # One contiguous row per variable, like a pandas column, so numpy sums the values in the same order as pandas
+        group_values = np.ascontiguousarray(values_by_variable[:, membership])
+        means[i] = nanmean(group_values)
+        sds[i] = nanstd(group_values)
+
+    return means, sds
+
+
+def _polynomial(coefficients, x):
+    """
+    Evaluates the polynomial coefficients[0] + coefficients[1] * x + coefficients[2] * x**2 + ...
+
+    Args:
+        coefficients (list of float): The coefficients, starting with the constant term.
+        x (float or np.ndarray): Where to evaluate the polynomial.
+
+    Returns:
+        float or np.ndarray: The value of the polynomial.
+    """
+    result = coefficients[-1]
+    for coefficient in coefficients[-2::-1]:
+        result = result * x + coefficient
+    return result
+
+
+@lru_cache(maxsize=None)
+def _get_shapiro_wilk_coefficients(n):
+    """
+    Calculates the Shapiro-Wilk coefficients for a sample size, as in algorithm AS R94 (Royston, 1995), which is
+    what `scipy.stats.shapiro()` uses. The coefficients only depend on n, so they are cached.
+
+    Args:
+        n (int): The sample size, at least 3.
+
+    Returns:
+        np.ndarray: Array of length n with the coefficients for the sorted sample. It is antisymmetric, so the
+            coefficients for the lower half are negative.
+    """
+    from scipy.special import ndtri  # Imported here, so scipy is only loaded by the stages using it
+
+    half_n = n // 2
+    if n == 3:
+        half_coefficients = np.array([np.sqrt(0.5)])
+    else:
+        m = ndtri((np.arange(1, half_n + 1) - 0.375) / (n + 0.25))
+        summ2 = 2 * np.sum(m**2)
+        ssumm2 = np.sqrt(summ2)
+        rsn = 1 / np.sqrt(n)
+        a1 = _polynomial([0.0, 0.221157, -0.147981, -2.071190, 4.434685, -2.706056], rsn) - m[0] / ssumm2
+
+        half_coefficients = -m
+        if n > 5:
+            a2 = -m[1] / ssumm2 + _polynomial([0.0, 0.042981, -0.293762, -1.752461, 5.682633, -3.582633], rsn)
+            fac = np.sqrt((summ2 - 2 * m[0]**2 - 2 * m[1]**2) / (1 - 2 * a1**2 - 2 * a2**2))
+            half_coefficients[2:] /= fac
+            half_coefficients[1] = a2
+        else:
+            fac = np.sqrt((summ2 - 2 * m[0]**2) / (1 - 2 * a1**2))
+            half_coefficients[1:] /= fac
+        half_coefficients[0] = a1
+
+    coefficients = np.zeros(n)
+    coefficients[:half_n] = -half_coefficients
+    coefficients[n - half_n:] = half_coefficients[::-1]
+    return coefficients
+
+
+def _shapiro_wilk_p_values(W, n):
+    """
+    Calculates p-values for Shapiro-Wilk W statistics with the approximations in algorithm AS R94.
+
+    Args:
+        W (np.ndarray): The W statistics, all for samples of size n.
+        n (int): The sample size, at least 3.
+
+    Returns:
+        np.ndarray: The p-values.
+    """
+    from scipy.special import ndtr
+
+    if n == 3:  # Exact
+        return np.maximum(6 / np.pi * (np.arcsin(np.sqrt(W)) - np.pi / 3), 0.0)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        y = np.log(1 - W)
+        if n <= 11:
+            gamma = _polynomial([-2.273, 0.459], n)
+            too_large = y >= gamma
+            y = -np.log(gamma - y)
+            m = _polynomial([0.5440, -0.39978, 0.025054, -6.714e-4], n)
+            s = np.exp(_polynomial([1.3822, -0.77857, 0.062767, -0.0020322], n))
+        else:
+            too_large = np.zeros(W.shape, dtype=bool)
+            m = _polynomial([-1.5861, -0.31082, -0.083751, 0.0038915], np.log(n))
+            s = np.exp(_polynomial([-0.4803, -0.082676, 0.0030302], np.log(n)))
+        p_values = ndtr(-(y - m) / s)
+
+    return np.where(too_large, 1e-19, p_values)
+
+
+def run_batched_shapiro_wilk_normality_test(samples):
+    """
+    Performs Shapiro-Wilk tests on many samples at once. The samples are grouped by size, and each size is tested
+    with vectorized operations on a matrix of the sorted samples. Agrees with `scipy.stats.shapiro()` to about 1e-9.
+
+    Like `run_shapriro_wilk_normality_test()`, samples with less than three values get W and p equal to -1. Samples
+    with missing values get nan, and samples where all values are equal get W and p equal to 1, like in scipy.
+
+    Args:
+        samples (list of pd.Series or list type): The samples to test for normality.
+
+    Returns:
+        list of dict: Dicts with the W and p values, in the same order as `samples`.
+    """
+    samples = [np.asarray(values, dtype=np.float64) for values in samples]
+    results = [{"W": -1, "p": -1} for _ in samples]
+
+    sample_indices_by_size = {}
+    for i, values in enumerate(samples):
+        if len(values) < 3:
+            continue
+        if np.isnan(values).any():
+            results[i] = {"W": np.float64(np.nan), "p": np.float64(np.nan)}
+            continue
+        sample_indices_by_size.setdefault(len(values), []).append(i)
+
+    for n, sample_indices in sample_indices_by_size.items():
+        values = np.sort(np.stack([samples[i] for i in sample_indices]), axis=1)
+        value_ranges = values[:, -1] - values[:, 0]
+        constant = value_ranges < 1e-19
+        scaled = values / np.where(constant, 1.0, value_ranges)[:, None]
+        centered = scaled - scaled.mean(axis=1, keepdims=True)
+
+        coefficients = _get_shapiro_wilk_coefficients(n)
+        ssa = np.sum(coefficients**2)
+        ssx = np.sum(centered**2, axis=1)
+        sax = centered @ coefficients
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ssassx = np.sqrt(ssa * ssx)
+            # One minus W, calculated like this to avoid rounding errors when W is close to 1
+            W1 = (ssassx - sax) * (ssassx + sax) / (ssa * ssx)
+        W = 1 - W1
+        p_values = _shapiro_wilk_p_values(W, n)
+
+        for i, sample_index in enumerate(sample_indices):
+            if constant[i]:
+                results[sample_index] = {"W": np.float64(1.0), "p": np.float64(1.0)}
+            else:
+                results[sample_index] = {"W": np.float64(W[i]), "p": np.float64(p_values[i])}
+
+    return results
+
+
 def run_shapriro_wilk_normality_test(values):
     """
     Performs a Shapiro-Wilk test on values, which tests if data is close to normally distributed.
@@ -51,10 +227,7 @@ def run_shapriro_wilk_normality_test(values):
     Returns:
         dict: Dict with the W and p values.
     """
-    if len(values) >= 3:
-        W1, p1 = shapiro(values)
-        return {"W": W1, "p": p1}
-    return {"W": -1, "p": - 1}
+    return run_batched_shapiro_wilk_normality_test([values])[0]
 
 
 def run_grouped_shapiro_wilk_normality_test(group_df1, group_df2, value_column, group_names):
@@ -83,15 +256,50 @@ def run_grouped_shapiro_wilk_normality_test(group_df1, group_df2, value_column,
         "normality": {},
     }
 
-    result["normality"][str(group_names[0])] = run_shapriro_wilk_normality_test(values1)
-    result["normality"][str(group_names[1])] = run_shapriro_wilk_normality_test(values2)
+    normality1, normality2 = run_batched_shapiro_wilk_normality_test([values1, values2])
+    result["normality"][str(group_names[0])] = normality1
+    result["normality"][str(group_names[1])] = normality2
 
     return result
 
 
-def run_group_test(group_df1, group_df2, value_column, test_type, group_names=None):
+def _make_group_test_result(values1, values2, value_column, test_type, group_names):
     """
-    Runs an independent samples test (t-test or Mann-Whitney U) on two groups.
+    Makes the result dict for a group test, with group sizes, means, standard deviations and normality checks.
+    The test statistic and p-value are left as None, to be filled in by the test.
+
+    Args:
+        values1 (pd.Series): Values for the first group.
+        values2 (pd.Series): Values for the second group.
+        value_column (str): Name of the column that is compared.
+        test_type (str): The name of the test.
+        group_names (list of str): Names for the two groups.
+
+    Returns:
+        dict: Dictionary with group labels, sizes, means and normality checks.
+    """
+    result = {
+        "test_variable": value_column,
+        "test_type": test_type,
+        "group_names": group_names,
+        "group_sizes": [len(values1), len(values2)],
+        "group_means": [values1.mean(), values2.mean()],
+        "group_sds": [values1.std(), values2.std()],
+        "normality": {},
+        "stat": None,
+        "p_value": None
+    }
+
+    normality1, normality2 = run_batched_shapiro_wilk_normality_test([values1, values2])
+    result["normality"][str(group_names[0])] = normality1
+    result["normality"][str(group_names[1])] = normality2
+
+    return result
+
+
+def run_group_test(group_df1, group_df2, value_column, test_type, group_names=None, random_state=None):
+    """
+    Runs an independent samples test (t-test, Mann-Whitney U or permutation test) on two groups.
     Also tests for normality with Shapiro-Wilk.
 
     Args:
@@ -100,14 +308,15 @@ def run_group_test(group_df1, group_df2, value_column, test_type, group_names=No
         value_column (str): Name of numeric column to compare between groups.
         test_type (str): In ["t-test", "mannwhitney", "u-test", "permutation"].
         group_names (list of str or None): Optional list of names for the two groups.
-        random_state (int or None): Random seed for reproducibility.
+        random_state (int, np.random.SeedSequence or None): Random seed for reproducibility, only used by the
+            permutation test. If None, uses `CONSTANTS["random_state"]`.
 
     Returns:
         Dictionary with group labels, sizes, means, normality checks, test statistic, and p-value.
     """
-    if test_type not in ["t-test", "mannwhitney", "u-test"]:
-        raise ValueError(
-            f"Unsupported test type. Use \"t-test\" or \"mannwhitney\". Got {test_type}")
+    test_types = ["t-test", "mannwhitney", "u-test", "permutation"]
+    if test_type not in test_types:
+        raise ValueError(f"Unsupported test type. Use one of {test_types}. Got {test_type}")
 
     if group_names is None:
         group_names = ["group1", "group2"]
@@ -115,25 +324,23 @@ def run_group_test(group_df1, group_df2, value_column, test_type, group_names=No
     values1 = group_df1[value_column]
     values2 = group_df2[value_column]
 
-    result = {
-        "test_variable": value_column,
-        "test_type": test_type,
-        "group_names": group_names,
-        "group_sizes": [len(values1), len(values2)],
-        "group_means": [values1.mean(), values2.mean()],
-        "group_sds": [values1.std(), values2.std()],
-        "normality": {},
-        "stat": None,
-        "p_value": None
-    }
-
-    result["normality"][str(group_names[0])] = run_shapriro_wilk_normality_test(values1)
-    result["normality"][str(group_names[1])] = run_shapriro_wilk_normality_test(values2)
+    result = _make_group_test_result(values1, values2, value_column, test_type, group_names)
 
     if test_type == "t-test":
+        from scipy.stats import ttest_ind
         stat, p_value = ttest_ind(values1, values2, equal_var=False)
     elif test_type in ["mannwhitney", "u-test"]:
-        stat, p_value = mannwhitneyu(values1, values2, alternative="two-sided", method="exact")
+        stat, p_value = run_exact_mann_whitney_u_test(values1, values2)
+    elif test_type == "permutation":
+        if random_state is None:
+            random_state = CONSTANTS["random_state"]
+        stats, p_values = _run_permutation_test(
+            values1.dropna().to_numpy(dtype=np.float64)[:, None],
+            values2.dropna().to_numpy(dtype=np.float64)[:, None],
+            n_permutations=CONSTANTS["n_permutations"],
+            random_state=random_state,
+        )
+        stat, p_value = stats[0], p_values[0]
 
     result["stat"] = stat
     result["p_value"] = p_value
@@ -141,28 +348,126 @@ def run_group_test(group_df1, group_df2, value_column, test_type, group_names=No
     return result
 
 
-def run_bootstrap_test(group_df1, group_df2, value_column, group_names=None):
+def _get_bootstrap_chunk_size(bytes_per_resample, memory_budget_mb=None):
     """
-    Runs a bootstrap hypothesis test between two groups based on the mean difference.
-    Also calculates group means, standard deviations, and Cohen's d.
+    Finds how many bootstrap resamples (or permutations) that can be made at once, so that all the arrays of one
+    chunk stay within the memory budget.
 
     Args:
-        group_df1 (pd.DataFrame): DataFrame for the first group.
-        group_df2 (pd.DataFrame): DataFrame for the second group.
-        value_column (str): Column name to compare.
-        group_names (list of str or None): Optional list of names for the two groups.
+        bytes_per_resample (int): The bytes of all the arrays held at once for one resample, like the indices, the
+            gathered values and the means.
+        memory_budget_mb (float or None): Memory budget in megabytes. If None, uses
+            `CONSTANTS["bootstrap_memory_budget_mb"]`.
 
     Returns:
-        dict: Results including group statistics, observed mean difference, bootstrap CI, and Cohen's d.
+        int: The number of resamples per chunk, at least 1.
     """
-    if group_names is None:
-        group_names = ["group1", "group2"]
+    if memory_budget_mb is None:
+        memory_budget_mb = CONSTANTS["bootstrap_memory_budget_mb"]
+    return max(int(memory_budget_mb * 1024**2 // max(bytes_per_resample, 1)), 1)
 
-    rng = np.random.default_rng(seed=CONSTANTS["random_state"])
 
-    values1 = group_df1[value_column].dropna()
-    values2 = group_df2[value_column].dropna()
+def _bootstrap_mean_differences(values1, values2, n_bootstraps, random_state, memory_budget_mb=None):
+    """
+    Draws bootstrap resamples of the difference in means between two samples.
+
+    The resamples are drawn as index matrices of shape (chunk_size, group_size), in chunks so that the memory
+    budget is kept. Each group gets its own random stream spawned from `random_state`, so the result only depends
+    on the seed, not on the chunk size.
 
+    Args:
+        values1 (np.ndarray): The values of the first group, without missing values.
+        values2 (np.ndarray): The values of the second group, without missing values.
+        n_bootstraps (int): The number of bootstrap resamples.
+        random_state (int or np.random.SeedSequence): Random seed for reproducibility.
+        memory_budget_mb (float or None): Memory budget in megabytes for one chunk of resamples.
+
+    Returns:
+        np.ndarray: Array of length `n_bootstraps` with the bootstrapped mean differences.
+    """
+    if not isinstance(random_state, np.random.SeedSequence):
+        random_state = np.random.SeedSequence(random_state)
+    rng1, rng2 = [np.random.default_rng(seed) for seed in random_state.spawn(2)]
+    n1 = len(values1)
+    n2 = len(values2)
+    # Per resample: the int64 indices and the float64 gathered values of both groups, and the two means and their
+    # difference
+    bytes_per_resample = 8 * (2 * (n1 + n2) + 3)
+    chunk_size = _get_bootstrap_chunk_size(bytes_per_resample, memory_budget_mb=memory_budget_mb)
+
+    bootstrap_diffs = np.empty(n_bootstraps, dtype=np.float64)
+    for start in range(0, n_bootstraps, chunk_size):
+        stop = min(start + chunk_size, n_bootstraps)
+        indices1 = rng1.integers(0, n1, size=(stop - start, n1))
+        indices2 = rng2.integers(0, n2, size=(stop - start, n2))
+        bootstrap_diffs[start:stop] = values1[indices1].mean(axis=1) - values2[indices2].mean(axis=1)
+
+    return bootstrap_diffs
+
+
+def _bootstrap_shared_mean_differences(values1, values2, n_bootstraps, random_state, memory_budget_mb=None):
+    """
+    Draws bootstrap resamples of the difference in means for several variables at once, reusing the same resampled
+    rows for every variable.
+
+    The resampled rows are turned into a matrix of how many times each row is drawn, so that the sums of all the
+    variables are found with one matrix product. Missing values are skipped when taking the means. The random streams
+    are the same as in `_bootstrap_mean_differences()`, so a variable without missing values gets the same resamples
+    as when it is bootstrapped alone.
+
+    Args:
+        values1 (np.ndarray): Array of shape (group_size, n_variables) for the first group.
+        values2 (np.ndarray): Array of shape (group_size, n_variables) for the second group.
+        n_bootstraps (int): The number of bootstrap resamples.
+        random_state (int or np.random.SeedSequence): Random seed for reproducibility.
+        memory_budget_mb (float or None): Memory budget in megabytes for one chunk of resamples.
+
+    Returns:
+        np.ndarray: Array of shape (n_bootstraps, n_variables) with the bootstrapped mean differences.
+    """
+    if not isinstance(random_state, np.random.SeedSequence):
+        random_state = np.random.SeedSequence(random_state)
+    rngs = [np.random.default_rng(seed) for seed in random_state.spawn(2)]
+    # Per resample and group: the int64 indices, the offset indices, the int64 and float64 draw counts. Then the sums,
+    # counts and means of every variable for both groups, and their differences.
+    bytes_per_resample = 8 * (4 * (len(values1) + len(values2)) + 7 * values1.shape[1])
+    chunk_size = _get_bootstrap_chunk_size(bytes_per_resample, memory_budget_mb=memory_budget_mb)
+
+    missing = [np.isnan(values) for values in (values1, values2)]
+    filled = [np.where(is_missing, 0.0, values) for values, is_missing in zip((values1, values2), missing)]
+    present = [(~is_missing).astype(np.float64) for is_missing in missing]
+
+    bootstrap_diffs = np.empty((n_bootstraps, values1.shape[1]), dtype=np.float64)
+    for start in range(0, n_bootstraps, chunk_size):
+        stop = min(start + chunk_size, n_bootstraps)
+        group_means = []
+        for rng, group_filled, group_present in zip(rngs, filled, present):
+            n = len(group_filled)
+            indices = rng.integers(0, n, size=(stop - start, n))
+            offsets = np.arange(stop - start)[:, None] * n
+            draw_counts = np.bincount((indices + offsets).ravel(), minlength=(stop - start) * n)
+            draw_counts = draw_counts.reshape(stop - start, n).astype(np.float64)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                group_means.append((draw_counts @ group_filled) / (draw_counts @ group_present))
+        bootstrap_diffs[start:stop] = group_means[0] - group_means[1]
+
+    return bootstrap_diffs
+
+
+def _make_bootstrap_result(values1, values2, bootstrap_diffs, value_column, group_names):
+    """
+    Calculates group means, standard deviations, Cohen's d and the confidence interval from bootstrapped differences.
+
+    Args:
+        values1 (pd.Series): Values for the first group, without missing values.
+        values2 (pd.Series): Values for the second group, without missing values.
+        bootstrap_diffs (np.ndarray): The bootstrapped mean differences.
+        value_column (str): Column name that was compared.
+        group_names (list of str): Names for the two groups.
+
+    Returns:
+        dict: Results including group statistics, observed mean difference, bootstrap CI, and Cohen's d.
+    """
     mean1 = values1.mean()
     mean2 = values2.mean()
     sd1 = values1.std()
@@ -174,15 +479,6 @@ def run_bootstrap_test(group_df1, group_df2, value_column, group_names=None):
     )
     cohens_d = observed_diff / pooled_sd
 
-    # Bootstrap
-    bootstrap_diffs = []
-    for _ in range(CONSTANTS["n_bootstraps"]):
-        sample1 = rng.choice(values1, size=len(values1), replace=True)
-        sample2 = rng.choice(values2, size=len(values2), replace=True)
-        diff = sample1.mean() - sample2.mean()
-        bootstrap_diffs.append(diff)
-
-    bootstrap_diffs = np.array(bootstrap_diffs)
     ci_lower = np.percentile(bootstrap_diffs, 2.5)
     ci_upper = np.percentile(bootstrap_diffs, 97.5)
 
@@ -201,7 +497,231 @@ def run_bootstrap_test(group_df1, group_df2, value_column, group_names=None):
     return result
 
 
-def run_friedman_test(df, test_variable, device):
+def run_bootstrap_test(group_df1, group_df2, value_column, group_names=None, random_state=None, memory_budget_mb=None):
+    """
+    Runs a bootstrap hypothesis test between two groups based on the mean difference.
+    Also calculates group means, standard deviations, and Cohen's d.
+
+    Args:
+        group_df1 (pd.DataFrame): DataFrame for the first group.
+        group_df2 (pd.DataFrame): DataFrame for the second group.
+        value_column (str): Column name to compare.
+        group_names (list of str or None): Optional list of names for the two groups.
+        random_state (int, np.random.SeedSequence or None): Random seed for reproducibility. If None, uses
+            `CONSTANTS["random_state"]`.
+        memory_budget_mb (float or None): Memory budget in megabytes for one chunk of resamples. If None, uses
+            `CONSTANTS["bootstrap_memory_budget_mb"]`.
+
+    Returns:
+        dict: Results including group statistics, observed mean difference, bootstrap CI, and Cohen's d.
+    """
+    if group_names is None:
+        group_names = ["group1", "group2"]
+    if random_state is None:
+        random_state = CONSTANTS["random_state"]
+
+    values1 = group_df1[value_column].dropna()
+    values2 = group_df2[value_column].dropna()
+
+    bootstrap_diffs = _bootstrap_mean_differences(
+        values1.to_numpy(dtype=np.float64),
+        values2.to_numpy(dtype=np.float64),
+        n_bootstraps=CONSTANTS["n_bootstraps"],
+        random_state=random_state,
+        memory_budget_mb=memory_budget_mb,
+    )
+
+    return _make_bootstrap_result(values1, values2, bootstrap_diffs, value_column, group_names)
+
+
+def run_shared_bootstrap_test(group_df1, group_df2, value_columns, group_names=None, random_state=None,
+                              memory_budget_mb=None):
+    """
+    Runs bootstrap hypothesis tests between two groups for several value columns, using the same resampled rows for
+    all the columns. The confidence intervals of the different columns are then correlated, and can be compared.
+
+    Args:
+        group_df1 (pd.DataFrame): DataFrame for the first group.
+        group_df2 (pd.DataFrame): DataFrame for the second group.
+        value_columns (list of str): Column names to compare.
+        group_names (list of str or None): Optional list of names for the two groups.
+        random_state (int, np.random.SeedSequence or None): Random seed for reproducibility. If None, uses
+            `CONSTANTS["random_state"]`.
+        memory_budget_mb (float or None): Memory budget in megabytes for one chunk of resamples. If None, uses
+            `CONSTANTS["bootstrap_memory_budget_mb"]`.
+
+    Returns:
+        dict: Dict from the value columns to the results, on the same format as `run_bootstrap_test()`.
+    """
+    if group_names is None:
+        group_names = ["group1", "group2"]
+    if random_state is None:
+        random_state = CONSTANTS["random_state"]
+
+    bootstrap_diffs = _bootstrap_shared_mean_differences(
+        group_df1[value_columns].to_numpy(dtype=np.float64),
+        group_df2[value_columns].to_numpy(dtype=np.float64),
+        n_bootstraps=CONSTANTS["n_bootstraps"],
+        random_state=random_state,
+        memory_budget_mb=memory_budget_mb,
+    )
+
+    results = {}
+    for i, value_column in enumerate(value_columns):
+        values1 = group_df1[value_column].dropna()
+        values2 = group_df2[value_column].dropna()
+        results[value_column] = _make_bootstrap_result(
+            values1, values2, bootstrap_diffs[:, i], value_column, group_names
+        )
+
+    return results
+
+
+def _get_permutation_labels(n1, n2, n_permutations, random_state, memory_budget_mb=None, n_variables=1):
+    """
+    Yields chunks of group label matrices for a permutation test. Each row has a 1 for the values that are put in the
+    first group and a 0 for the ones put in the second group.
+
+    If there are at most `n_permutations` ways to split the values into the groups, all of them are enumerated and
+    the test is exact. Otherwise `n_permutations` random splits are drawn, by shuffling all the rows of a label matrix
+    at once.
+
+    Args:
+        n1 (int): Size of the first group.
+        n2 (int): Size of the second group.
+        n_permutations (int): The largest number of splits to enumerate, and the number of random splits otherwise.
+        random_state (int or np.random.SeedSequence): Random seed for reproducibility.
+        memory_budget_mb (float or None): Memory budget in megabytes for one chunk of labels, and the group sums and
+            means found from them.
+        n_variables (int): The number of variables tested with the labels, for the memory of the sums and means.
+
+    Yields:
+        np.ndarray: Array of shape (chunk_size, n1 + n2) with the group labels.
+    """
+    n = n1 + n2
+    # Per split: the float64 labels, the tiled or enumerated copy they are made from (the enumerated splits are tuples
+    # of about 8 bytes per value), and the sums, counts and mean differences of the variables
+    bytes_per_resample = 8 * (2 * n + 5 * n_variables) + 64
+    chunk_size = _get_bootstrap_chunk_size(bytes_per_resample, memory_budget_mb=memory_budget_mb)
+
+    n_splits = comb(n, n1)
+    if n_splits <= n_permutations:  # Exact, enumerate all the ways to pick the first group
+        splits = combinations(range(n), n1)
+        for start in range(0, n_splits, chunk_size):
+            chunk = list(islice(splits, chunk_size))
+            indices = np.array(chunk, dtype=np.int64).reshape(len(chunk), n1)
+            labels = np.zeros((len(chunk), n), dtype=np.float64)
+            np.put_along_axis(labels, indices, 1.0, axis=1)
+            yield labels
+        return
+
+    rng = np.random.default_rng(random_state)
+    base_labels = np.concatenate([np.ones(n1), np.zeros(n2)])
+    for start in range(0, n_permutations, chunk_size):
+        stop = min(start + chunk_size, n_permutations)
+        yield rng.permuted(np.tile(base_labels, (stop - start, 1)), axis=1)
+
+
+def _run_permutation_test(values1, values2, n_permutations, random_state, memory_budget_mb=None):
+    """
+    Runs two-sided permutation tests on the difference in means for several variables at once. The same group
+    splits are used for every variable, and the group sums for all of them are found with matrix products. Missing
+    values are skipped per variable.
+
+    With an exact test, the p-value is the share of splits with an absolute difference at least as large as the
+    observed one. With random splits, the observed split is counted as well, so the p-value is never zero.
+
+    Args:
+        values1 (np.ndarray): Array of shape (group_size, n_variables) for the first group.
+        values2 (np.ndarray): Array of shape (group_size, n_variables) for the second group.
+        n_permutations (int): The largest number of splits to enumerate, and the number of random splits otherwise.
+        random_state (int or np.random.SeedSequence): Random seed for reproducibility.
+        memory_budget_mb (float or None): Memory budget in megabytes for one chunk of labels.
+
+    Returns:
+        tuple: Arrays of length n_variables with the observed mean differences and the p-values.
+    """
+    n1 = len(values1)
+    n2 = len(values2)
+    values = np.concatenate([values1, values2])
+    present = (~np.isnan(values)).astype(np.float64)
+    filled = np.where(np.isnan(values), 0.0, values)
+    total_sums = filled.sum(axis=0)
+    total_counts = present.sum(axis=0)
+
+    def mean_differences(labels):
+        sums1 = labels @ filled
+        counts1 = labels @ present
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return sums1 / counts1 - (total_sums - sums1) / (total_counts - counts1)
+
+    observed = mean_differences(np.concatenate([np.ones(n1), np.zeros(n2)])[None, :])[0]
+    tolerance = 1e-12 * np.maximum(np.abs(observed), 1)
+
+    n_extreme = np.zeros(values.shape[1])
+    n_splits = 0
+    labels_chunks = _get_permutation_labels(
+        n1, n2, n_permutations, random_state, memory_budget_mb=memory_budget_mb, n_variables=values.shape[1]
+    )
+    for labels in labels_chunks:
+        differences = mean_differences(labels)
+        n_extreme += (np.abs(differences) >= np.abs(observed) - tolerance).sum(axis=0)
+        n_splits += len(labels)
+
+    if comb(n1 + n2, n1) <= n_permutations:
+        p_values = n_extreme / n_splits
+    else:
+        p_values = (n_extreme + 1) / (n_splits + 1)
+    p_values[np.isnan(observed)] = np.nan
+
+    return observed, p_values
+
+
+def run_shared_permutation_test(group_df1, group_df2, value_columns, group_names=None, random_state=None,
+                                memory_budget_mb=None):
+    """
+    Runs permutation tests on the difference in means between two groups for several value columns, using the same
+    group splits for all of them. The results are on the same format as `run_group_test()`.
+
+    Args:
+        group_df1 (pd.DataFrame): Dataframe with rows for the first group.
+        group_df2 (pd.DataFrame): Dataframe with rows for the second group.
+        value_columns (list of str): Names of the numeric columns to compare between groups.
+        group_names (list of str or None): Optional list of names for the two groups.
+        random_state (int, np.random.SeedSequence or None): Random seed for reproducibility. If None, uses
+            `CONSTANTS["random_state"]`.
+        memory_budget_mb (float or None): Memory budget in megabytes for one chunk of labels. If None, uses
+            `CONSTANTS["bootstrap_memory_budget_mb"]`.
+
+    Returns:
+        dict: Dict from the value columns to the results.
+    """
+    if group_names is None:
+        group_names = ["group1", "group2"]
+    if random_state is None:
+        random_state = CONSTANTS["random_state"]
+
+    stats, p_values = _run_permutation_test(
+        group_df1[value_columns].to_numpy(dtype=np.float64),
+        group_df2[value_columns].to_numpy(dtype=np.float64),
+        n_permutations=CONSTANTS["n_permutations"],
+        random_state=random_state,
+        memory_budget_mb=memory_budget_mb,
+    )
+
+    results = {}
+    for i, value_column in enumerate(value_columns):
+        result = _make_group_test_result(
+            group_df1[value_column], group_df2[value_column], value_column, "permutation", group_names
+        )
+        result["stat"] = stats[i]
+        result["p_value"] = p_values[i]
+        results[value_column] = result
+
+    return results
+
+
+def run_friedman_test(df, test_variable, device, cube=None):
     """
     Runs the Friedman test on repeated ordinal data across multiple websites.
 
@@ -209,6 +729,8 @@ def run_friedman_test(df, test_variable, device):
         df (pd.DataFrame): The data from the study.
         test_variable (str): The variable to test, either "accepts" or "time".
         device (str): The device to test, either "computer", "phone" or "both".
+        cube (ResponseCube or None): The responses in `df`. If None, uses the shared cube from
+            `src.response_cube.get_dataframe_cube()`.
 
     Returns:
         Dictionary with test type, websites, test statistic, degrees of freedom, and p-value.
@@ -221,23 +743,14 @@ def run_friedman_test(df, test_variable, device):
     if device not in device_values:
         raise ValueError(f"Argument `device` must be in {device_values}. Was {device}.")
 
-    if device == "both":
-        if test_variable == "accepts":
-            column_ending = "_accepts_int"
-        if test_variable == "time":
-            column_ending = "_average_time"
-        columns = [f"{website}{column_ending}" for website in WEBSITES]
-    else:
-        if test_variable == "accepts":
-            column_ending = ".answer.int"
-        if test_variable == "time":
-            column_ending = ".time"
-        columns = [f"{device}.{website}{column_ending}" for website in WEBSITES]
-
-    data = df[columns]
+    # One column per website. For "both", the devices are summed.
+    if cube is None:
+        cube = get_dataframe_cube(df)
+    data = cube.to_frame(test_variable, device)
 
     # Friedman expects each column to be a condition, and each row to be a subject
-    statistic, p_value = friedmanchisquare(*[data[col] for col in columns])
+    from scipy.stats import friedmanchisquare
+    statistic, p_value = friedmanchisquare(*[data[website] for website in WEBSITES])
 
     return {
         "test_type": "friedman",
@@ -265,7 +778,7 @@ def run_device_wilcoxon_tests(df, column_name1, column_name2, min_group_size=3):
     # Wilcoxon test can only use values were the participants have answered differently for the two options
     accept_mask = df[[column_name1, column_name2]].notna().all(axis=1)
     if accept_mask.sum() >= min_group_size:
-        stat, p_value = wilcoxon(
+        stat, p_value = run_wilcoxon_test(
             df.loc[accept_mask, column_name1],
             df.loc[accept_mask, column_name2]
         )
@@ -275,7 +788,7 @@ def run_device_wilcoxon_tests(df, column_name1, column_name2, min_group_size=3):
     return {"stat": stat, "p_value": p_value}
 
 
-def run_pairwise_wilcoxon_tests(df, test_variable, device):
+def run_pairwise_wilcoxon_tests(df, test_variable, device, cube=None):
     """
     Runs Wilcoxon signed-rank tests for all pairs of websites with ordinal response values (0-2).
 
@@ -283,6 +796,8 @@ def run_pairwise_wilcoxon_tests(df, test_variable, device):
         df (pd.DataFrame): DataFrame of ordinal data per website per participant.
         test_variable (str): The variable to test, either "accepts" or "time".
         device (str): The device to test, either "computer", "phone" or "both".
+        cube (ResponseCube or None): The responses in `df`. If None, uses the shared cube from
+            `src.response_cube.get_dataframe_cube()`.
 
     Returns:
         List of dictionaries with test results for each pair of websites.
@@ -295,32 +810,23 @@ def run_pairwise_wilcoxon_tests(df, test_variable, device):
     if device not in device_values:
         raise ValueError(f"Argument `device` must be in {device_values}. Was {device}.")
 
-    if device == "both":
-        if test_variable == "accepts":
-            column_ending = "_accepts_int"
-        if test_variable == "time":
-            column_ending = "_average_time"
-        website_to_column_mapping = {website: f"{website}{column_ending}" for website in WEBSITES}
-    else:
-        if test_variable == "accepts":
-            column_ending = ".answer.int"
-        if test_variable == "time":
-            column_ending = ".time"
-        website_to_column_mapping = {website: f"{device}.{website}{column_ending}" for website in WEBSITES}
+    # One column per website. For "both", the devices are summed.
+    if cube is None:
+        cube = get_dataframe_cube(df)
+    data = cube.to_frame(test_variable, device)
 
     results = []
 
     for site1, site2 in combinations(WEBSITES, 2):
-        col1 = website_to_column_mapping[site1]
-        col2 = website_to_column_mapping[site2]
-
         # Drop rows with equal values — wilcoxon test requires non-zero differences
-        mask = df[col1] != df[col2]
-        data1 = df.loc[mask, col1]
-        data2 = df.loc[mask, col2]
+        mask = data[site1] != data[site2]
+        data1 = data.loc[mask, site1]
+        data2 = data.loc[mask, site2]
 
         if len(data1) >= 3:
-            stat, p_value = wilcoxon(data1, data2, zero_method="wilcox", alternative="two-sided", method="auto")
+            stat, p_value = run_wilcoxon_test(
+                data1, data2, zero_method="wilcox", alternative="two-sided", method="auto"
+            )
         else:
             stat, p_value = None, None
 
@@ -346,5 +852,7 @@ def run_withdrawal_wilcoxon_test(df):
         dict: {"stat": test statistic, "p_value": p-value}
     """
     valid = df.dropna(subset=["average_consent_given_withdrawal_times", "average_withdrawal_times"])
-    stat, p_value = wilcoxon(valid["average_consent_given_withdrawal_times"], valid["average_withdrawal_times"])
+    stat, p_value = run_wilcoxon_test(
+        valid["average_consent_given_withdrawal_times"], valid["average_withdrawal_times"]
+    )
     return {"stat": stat, "p_value": p_value}
@@ -0,0 +1,76 @@
+import json
+import subprocess
+import sys
+
+from src.get_constants import PROJECT_ROOT, get_constants
+
+CONSTANTS = get_constants()
+
+# The modules main.py needs to start, before any stage has run
+STARTUP_MODULES = ["src.utils", "src.pipeline", "src.hypothesis_tests"]
+
+# Slow to import, so only the stages that need them should import them
+HEAVY_MODULES = ["matplotlib", "scipy"]
+
+
+def measure_import_time(modules):
+    """
+    Imports modules in a new Python process, so that nothing is imported already, and measures the time it takes.
+
+    Args:
+        modules (list of str): The modules to import.
+
+    Returns:
+        dict: The import time in seconds under "seconds", and the top level packages that got imported under
+            "packages".
+    """
+    code = (
+        "import json, sys, time\n"
+        "start = time.perf_counter()\n"
+        f"for module in {list(modules)!r}:\n"
+        "    __import__(module)\n"
+        "seconds = time.perf_counter() - start\n"
+        "packages = sorted({name.split('.')[0] for name in sys.modules})\n"
+        "print(json.dumps({'seconds': seconds, 'packages': packages}))\n"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], cwd=PROJECT_ROOT, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output)
+
+
+def check_import_budget(modules=None, budget_seconds=None):
+    """
+    Checks that the modules can be imported within the time budget, and without importing the heavy modules in
+    `HEAVY_MODULES`.
+
+    Args:
+        modules (list of str or None): The modules to import. If None, uses `STARTUP_MODULES`.
+        budget_seconds (float or None): The time budget. If None, uses `CONSTANTS["import_time_budget_seconds"]`.
+
+    Raises:
+        RuntimeError: If a heavy module is imported, or the import takes longer than the budget.
+
+    Returns:
+        float: The import time in seconds.
+    """
+    if modules is None:
+        modules = STARTUP_MODULES
+    if budget_seconds is None:
+        budget_seconds = CONSTANTS["import_time_budget_seconds"]
+
+    measurement = measure_import_time(modules)
+    heavy_modules = [module for module in HEAVY_MODULES if module in measurement["packages"]]
+    if heavy_modules:
+        raise RuntimeError(f"Importing {modules} also imports {heavy_modules}, which should be imported lazily. ")
+    if measurement["seconds"] > budget_seconds:
+        raise RuntimeError(
+            f"Importing {modules} took {measurement['seconds']:.2f} seconds, more than the budget of "
+            f"{budget_seconds} seconds. "
+        )
+    return measurement["seconds"]
+
+
+if __name__ == "__main__":
+    seconds = check_import_budget()
+    print(f"Imported {STARTUP_MODULES} in {seconds:.2f} seconds, within the budget.")
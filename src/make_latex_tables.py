@@ -3,72 +3,12 @@ import re
 import numpy as np
 import pandas as pd
 from src.get_constants import get_constants
+from src.process_data import get_nettskjema_answer_options
 
 CONSTANTS = get_constants()
 WEBSITES = CONSTANTS["websites"]
 
 
-def _get_nettskjema_answer_options():
-    """
-    Returns the answers options for the nettskjema questions, as values in a dict where the
-    keys are the columns for the respective questions.
-
-    Returns:
-        dict: The answer options.
-    """
-    all_nettskjema_answer_options = {
-        "privacy_concern": [
-            "Very concerned",
-            "Quite concerned",
-            "Slightly concerned",
-            "Don't know",
-        ],
-        "knows_cookies": [
-            "Yes",
-            "No",
-        ],
-        "understand_cookie_consent": [
-            "To a great extent",
-            "To some extent",
-            "Neither nor",
-            "To a small extent",
-            "Not at all",
-            "Don't know",
-        ],
-        "cookie_sharing_feeling": [
-            "I want as little information as possible about me and my online activity to be saved and shared.",
-            "I want information about me and my online activity to be saved and shared, "
-            "since it improves my user experience.",
-            "I am indifferent to my information and online activity being saved and shared.",
-            "Don't know",
-        ],
-        "cookie_banner_response": [
-            "I ignore them and leave them open.",
-            "I choose the easiest option, whether it's accept or decline.",
-            "I try to decline when possible, but accept if rejecting is too much effort.",
-            "I actively take steps to withhold my consent.",
-            "I consent because it improves my user experience.",
-            "Don't know",
-        ],
-        "have_withdrawn_consent": ["Yes", "No", "Don't know"],
-        "aware_withdrawal_ease": ["Yes", "No", "Don't know"],
-        "age": [
-            "15 - 19 years",
-            "20 - 29 years",
-            "30 - 39 years",
-            "40 - 49 years",
-            "50 - 59 years",
-            "60+ years",
-        ],
-        "it_background": [
-            "Yes, programming and/or design related",
-            "Yes, other",
-            "No",
-        ],
-    }
-    return all_nettskjema_answer_options
-
-
 def _get_nettskjema_question_mapping():
     """
     Maps the column names for the questions to the actual questions with numbers.
@@ -125,7 +65,7 @@ def make_nettskjema_report_latex(df, caption="", label=""):
     Returns:
         str: The LaTeX table as a string.
     """
-    all_nettskjema_answer_options = _get_nettskjema_answer_options()
+    all_nettskjema_answer_options = get_nettskjema_answer_options()
     nettskjema_question_mapping = _get_nettskjema_question_mapping()
     columns = list(all_nettskjema_answer_options.keys())
 
@@ -601,7 +541,7 @@ def make_withdrawal_statistics_latex_table(results_dict, caption="", label=""):
         "both": "Both devices"
     }
 
-    website_order = WEBSITES + ["all"]
+    website_order = [*WEBSITES, "all"]
 
     for website in website_order:
         for device in ["computer", "phone", "both"]:
@@ -1,11 +1,8 @@
 import os
-from pathlib import Path
 
-import matplotlib.pyplot as plt
 import numpy as np
-from matplotlib.lines import Line2D
 
-from src.get_constants import get_constants
+from src.get_constants import PROJECT_ROOT, get_constants
 
 CONSTANTS = get_constants()
 WEBSITES = CONSTANTS["websites"]
@@ -21,10 +18,17 @@ def plot_response_times_per_device(df, device, max_time=31, time_scale_factor=1.
         max_time (int): The highest amount of response time that will be shown in the plot.
         time_scale_factor (float): Optional scaling of x-axis (default 1.0 = seconds).
         show (bool): Whether or not to show the plot.
+
+    Returns:
+        Path: The path to the saved plot.
     """
     if device not in ["computer", "phone"]:
         raise ValueError("Device must be 'computer' or 'phone'.")
 
+    # Imported here, since matplotlib is slow to import and only needed for the plots
+    import matplotlib.pyplot as plt
+    from matplotlib.lines import Line2D
+
     # Prepare column names based on device
     time_columns = {website: f"{device}.{website}.time" for website in WEBSITES}
     accept_columns = {website: f"{device}.{website}.answer.int" for website in WEBSITES}
@@ -73,11 +77,11 @@ def plot_response_times_per_device(df, device, max_time=31, time_scale_factor=1.
     plt.tight_layout()
 
     # Save the plot to file
-    plots_folder_path = Path(CONSTANTS["paths"]["folders"]["plots_folder"])
+    plots_folder_path = PROJECT_ROOT / CONSTANTS["paths"]["folders"]["plots_folder"]
     file_path = plots_folder_path / CONSTANTS["paths"]["filenames"][f"answer_times_line_plot_{device}"]
-    if not os.path.exists(plots_folder_path):
-        os.makedirs(plots_folder_path)
+    os.makedirs(plots_folder_path, exist_ok=True)
     plt.savefig(file_path)
 
     if show:
         plt.show()
+    return file_path
@@ -0,0 +1,247 @@
+import functools
+import hashlib
+import inspect
+import os
+import tempfile
+
+import numpy as np
+
+from src.get_constants import get_constants
+from src.paths import CACHE_FOLDER
+
+CONSTANTS = get_constants()
+NULL_DISTRIBUTIONS_FOLDER = CACHE_FOLDER / "null_distributions"
+
+# Bump when the layout of the saved files change, so old files are built again
+NULL_DISTRIBUTIONS_VERSION = 1
+
+# Process-wide cache of the null distributions, keyed on the name of the test and the sample sizes.
+_NULL_DISTRIBUTIONS = {}
+
+
+@functools.lru_cache(maxsize=None)
+def _get_builder_hash(build_function):
+    """
+    Hashes the source code of a function building null distributions, so files saved by an older version of it are
+    not used.
+    """
+    return hashlib.sha256(inspect.getsource(build_function).encode()).hexdigest()[:12]
+
+
+def _get_null_distribution_path(key, build_function):
+    """
+    Returns the path of the saved null distribution, named by the key, the file version and the builder hash.
+    """
+    name = "_".join(str(part) for part in key)
+    return NULL_DISTRIBUTIONS_FOLDER / f"{name}_v{NULL_DISTRIBUTIONS_VERSION}_{_get_builder_hash(build_function)}.npy"
+
+
+def _load_null_distribution(file_path):
+    """
+    Loads a saved null distribution.
+
+    Returns:
+        np.ndarray or None: The distribution, or None if the file does not exist or can not be read.
+    """
+    try:
+        pmf = np.load(file_path)
+    except (OSError, ValueError, EOFError):  # Missing or broken file, which is built again
+        return None
+    return pmf if pmf.ndim == 1 else None
+
+
+def _save_null_distribution(file_path, pmf):
+    """
+    Saves a null distribution. It is written to a temporary file first and then moved into place, so other processes
+    never read a half written file.
+    """
+    NULL_DISTRIBUTIONS_FOLDER.mkdir(parents=True, exist_ok=True)
+    file_descriptor, temporary_path = tempfile.mkstemp(dir=NULL_DISTRIBUTIONS_FOLDER, suffix=".npy.tmp")
+    try:
+        with os.fdopen(file_descriptor, "wb") as outfile:
+            np.save(outfile, pmf)
+        os.replace(temporary_path, file_path)
+    except BaseException:
+        os.unlink(temporary_path)
+        raise
+
+
+def _get_null_distribution(key, build_function):
+    """
+    Returns a null distribution from the cache. If it is not cached, loads it from disk or builds it.
+
+    Args:
+        key (tuple): The name of the test followed by the sample sizes, for example ("mannwhitneyu", 8, 12).
+        build_function (callable): Function that builds the distribution from the sample sizes in `key`.
+
+    Returns:
+        np.ndarray: The probability mass function of the test statistic.
+    """
+    if key in _NULL_DISTRIBUTIONS:
+        return _NULL_DISTRIBUTIONS[key]
+
+    persist = CONSTANTS["persist_null_distributions"]
+    file_path = _get_null_distribution_path(key, build_function)
+    pmf = _load_null_distribution(file_path) if persist else None
+    if pmf is None:
+        pmf = build_function(*key[1:])
+        if persist:
+            _save_null_distribution(file_path, pmf)
+
+    _NULL_DISTRIBUTIONS[key] = pmf
+    return pmf
+
+
+def _build_mann_whitney_u_distribution(n1, n2):
+    """
+    Builds the exact null distribution of the Mann-Whitney U statistic, using the recurrence
+    P(U = u | a, b) = a / (a + b) * P(U = u - b | a - 1, b) + b / (a + b) * P(U = u | a, b - 1).
+    Only positive terms are added, so the tails are accurate as well.
+
+    Args:
+        n1 (int): The smallest sample size.
+        n2 (int): The largest sample size.
+
+    Returns:
+        np.ndarray: Array of length n1 * n2 + 1 with the probabilities of U = 0, ..., n1 * n2.
+    """
+    pmfs = np.zeros((n1 + 1, n1 * n2 + 1))
+    pmfs[:, 0] = 1.0  # With an empty second sample, U is always 0
+    for b in range(1, n2 + 1):
+        for a in range(1, n1 + 1):
+            pmf = pmfs[a] * (b / (a + b))
+            pmf[b:] += pmfs[a - 1, :-b] * (a / (a + b))
+            pmfs[a] = pmf
+    return pmfs[n1]
+
+
+def _build_wilcoxon_distribution(n):
+    """
+    Builds the exact null distribution of the Wilcoxon signed-rank statistic (the sum of the positive ranks).
+
+    Args:
+        n (int): The number of non-zero differences.
+
+    Returns:
+        np.ndarray: Array of length n * (n + 1) / 2 + 1 with the probabilities of the rank sums 0, ..., n(n + 1)/2.
+    """
+    pmf = np.ones(1)
+    for k in range(1, n + 1):
+        previous_pmf = pmf
+        pmf = np.zeros(k * (k + 1) // 2 + 1)
+        pmf[:len(previous_pmf)] = previous_pmf * 0.5
+        pmf[-len(previous_pmf):] += previous_pmf * 0.5
+    return pmf
+
+
+def get_mann_whitney_u_distribution(n1, n2):
+    """
+    Returns the cached exact null distribution of the Mann-Whitney U statistic for the sample sizes.
+
+    Args:
+        n1 (int): Size of the first sample.
+        n2 (int): Size of the second sample.
+
+    Returns:
+        np.ndarray: Array of length n1 * n2 + 1 with the probabilities of U = 0, ..., n1 * n2.
+    """
+    n1, n2 = min(n1, n2), max(n1, n2)  # The distribution is symmetric in the sample sizes
+    return _get_null_distribution(("mannwhitneyu", n1, n2), _build_mann_whitney_u_distribution)
+
+
+def get_wilcoxon_distribution(n):
+    """
+    Returns the cached exact null distribution of the Wilcoxon signed-rank statistic for the sample size.
+
+    Args:
+        n (int): The number of non-zero differences.
+
+    Returns:
+        np.ndarray: Array of length n * (n + 1) / 2 + 1 with the probabilities of the rank sums 0, ..., n(n + 1)/2.
+    """
+    return _get_null_distribution(("wilcoxon", n), _build_wilcoxon_distribution)
+
+
+def run_exact_mann_whitney_u_test(values1, values2):
+    """
+    Runs a two-sided exact Mann-Whitney U test, like `scipy.stats.mannwhitneyu(method="exact")`, but with the null
+    distribution taken from the cache.
+
+    Args:
+        values1 (pd.Series or list type): The values of the first sample.
+        values2 (pd.Series or list type): The values of the second sample.
+
+    Returns:
+        tuple: The U statistic of the first sample and the p-value.
+    """
+    from scipy.stats import mannwhitneyu, rankdata  # Imported here, so scipy is only loaded by the stages using it
+
+    values1 = np.asarray(values1, dtype=np.float64)
+    values2 = np.asarray(values2, dtype=np.float64)
+    n1 = len(values1)
+    n2 = len(values2)
+    if n1 == 0 or n2 == 0 or np.isnan(values1).any() or np.isnan(values2).any():
+        # Let scipy handle the edge cases, so that they behave the same
+        return tuple(mannwhitneyu(values1, values2, alternative="two-sided", method="exact"))
+
+    ranks = rankdata(np.concatenate([values1, values2]))
+    U1 = ranks[:n1].sum() - n1 * (n1 + 1) / 2
+    U2 = n1 * n2 - U1
+    U = int(max(U1, U2))
+
+    pmf = get_mann_whitney_u_distribution(n1, n2)
+    p_value = min(2 * pmf[U:].sum(), 1.0)
+
+    return np.float64(U1), np.float64(p_value)
+
+
+def run_wilcoxon_test(x, y, zero_method="wilcox", alternative="two-sided", method="auto"):
+    """
+    Runs a Wilcoxon signed-rank test like `scipy.stats.wilcoxon()`, but with the exact null distributions taken
+    from the cache.
+
+    The exact distribution is used when there are no ties, zeros or missing values, and the sample size is at most
+    `CONSTANTS["wilcoxon_exact_max_n"]` (or `method="exact"`). This is the same choice as scipy makes, except that
+    the size limit can be raised above scipy's 50. All other cases are passed on to scipy.
+
+    Args:
+        x (pd.Series or list type): The first measurements.
+        y (pd.Series or list type): The second measurements.
+        zero_method (str): How to handle zero differences, see `scipy.stats.wilcoxon()`.
+        alternative (str): In ["two-sided", "less", "greater"].
+        method (str): In ["auto", "exact", "asymptotic"].
+
+    Returns:
+        tuple: The test statistic and the p-value.
+    """
+    from scipy.stats import rankdata, wilcoxon
+
+    differences = np.asarray(x, dtype=np.float64) - np.asarray(y, dtype=np.float64)
+    n = len(differences)
+    absolute_differences = np.abs(differences)
+    has_ties_or_zeros = (differences == 0).any() or len(np.unique(absolute_differences)) < n
+    if method == "auto":
+        use_cached_exact = n <= CONSTANTS["wilcoxon_exact_max_n"]
+    else:
+        use_cached_exact = method == "exact"
+    if n == 0 or zero_method != "wilcox" or np.isnan(differences).any() or has_ties_or_zeros:
+        use_cached_exact = False
+    if not use_cached_exact:
+        return tuple(wilcoxon(x, y, zero_method=zero_method, alternative=alternative, method=method))
+
+    ranks = rankdata(absolute_differences)
+    r_plus = ranks[differences > 0].sum()
+    r_minus = ranks[differences < 0].sum()
+
+    pmf = get_wilcoxon_distribution(n)
+    cdf = np.cumsum(pmf)
+    sf = np.cumsum(pmf[::-1])[::-1]
+    if alternative == "less":
+        p_value = cdf[int(r_plus)]
+    elif alternative == "greater":
+        p_value = sf[int(r_plus)]
+    else:
+        p_value = min(2 * min(sf[int(r_plus)], cdf[int(r_plus)]), 1.0)
+
+    statistic = min(r_plus, r_minus) if alternative == "two-sided" else r_plus
+    return np.float64(statistic), np.float64(p_value)
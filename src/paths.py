@@ -1,22 +1,35 @@
-from pathlib import Path
-
-from src.get_constants import get_constants
+from src.get_constants import PROJECT_ROOT, get_constants
 
 
 PATHS = get_constants()["paths"]
 
-DATA_FOLDER = Path(PATHS["folders"]["data_folder"])
+DATA_FOLDER = PROJECT_ROOT / PATHS["folders"]["data_folder"]
 PARTICIPANTS_FOLDER_BASE = PATHS["folders"]["participant_folder_base"]
+CACHE_FOLDER = PROJECT_ROOT / PATHS["folders"]["cache_folder"]
+RESPONSE_CUBE_FOLDER = CACHE_FOLDER / PATHS["folders"]["response_cube_folder"]
+RESULTS_FOLDER = PROJECT_ROOT / PATHS["folders"]["results_folder"]
 
 NETTSKJEMA_FILENAME = PATHS["filenames"]["nettskjema"]
 EXPERIMENT_RESULTS_FILENAME = PATHS["filenames"]["experiment_results"]
 ALL_EXPERIMENTS_FILENAME = PATHS["filenames"]["all_experiment_results"]
 NETTSKJEMA_QUESTIONS_FILENAME = PATHS["filenames"]["nettskjema_questions"]
 QUALITATIVE_ANSWERS_FILENAME = PATHS["filenames"]["qualitative_answers"]
+DATA_SNAPSHOT_FILENAME = PATHS["filenames"]["data_snapshot"]
+DATA_SNAPSHOT_FINGERPRINT_FILENAME = PATHS["filenames"]["data_snapshot_fingerprint"]
+PARTICIPANT_CACHE_FILENAME = PATHS["filenames"]["participant_cache"]
+NETTSKJEMA_CACHE_FILENAME = PATHS["filenames"]["nettskjema_cache"]
+NETTSKJEMA_CACHE_FINGERPRINT_FILENAME = PATHS["filenames"]["nettskjema_cache_fingerprint"]
+PIPELINE_MANIFEST_FILENAME = PATHS["filenames"]["pipeline_manifest"]
 
 NETTSKJEMA_PATH = DATA_FOLDER / NETTSKJEMA_FILENAME
 ALL_EXPERIMENTS_PATH = DATA_FOLDER / ALL_EXPERIMENTS_FILENAME
 NETTSKJEMA_QUESTIONS_PATH = DATA_FOLDER / NETTSKJEMA_QUESTIONS_FILENAME
+DATA_SNAPSHOT_PATH = CACHE_FOLDER / DATA_SNAPSHOT_FILENAME
+DATA_SNAPSHOT_FINGERPRINT_PATH = CACHE_FOLDER / DATA_SNAPSHOT_FINGERPRINT_FILENAME
+PARTICIPANT_CACHE_PATH = CACHE_FOLDER / PARTICIPANT_CACHE_FILENAME
+NETTSKJEMA_CACHE_PATH = CACHE_FOLDER / NETTSKJEMA_CACHE_FILENAME
+NETTSKJEMA_CACHE_FINGERPRINT_PATH = CACHE_FOLDER / NETTSKJEMA_CACHE_FINGERPRINT_FILENAME
+PIPELINE_MANIFEST_PATH = CACHE_FOLDER / PIPELINE_MANIFEST_FILENAME
 
 
 def get_experiment_results_path(participant_number):
@@ -32,3 +45,18 @@ def get_experiment_results_path(participant_number):
     folder_path = DATA_FOLDER / (PARTICIPANTS_FOLDER_BASE + str(participant_number))
     file_path = folder_path / EXPERIMENT_RESULTS_FILENAME
     return file_path
+
+
+def get_participant_numbers():
+    """
+    Finds the participants with experiment results, by looking for participant folders in the data folder.
+
+    Returns:
+        list of int: The participant numbers, sorted.
+    """
+    participant_numbers = []
+    for folder_path in DATA_FOLDER.glob(PARTICIPANTS_FOLDER_BASE + "*"):
+        suffix = folder_path.name[len(PARTICIPANTS_FOLDER_BASE):]
+        if suffix.isdigit() and (folder_path / EXPERIMENT_RESULTS_FILENAME).exists():
+            participant_numbers.append(int(suffix))
+    return sorted(participant_numbers)
@@ -0,0 +1,197 @@
+import functools
+import hashlib
+import json
+import os
+
+import src.latex_table_captions
+from src.get_constants import get_constants
+from src.paths import CACHE_FOLDER, PIPELINE_MANIFEST_PATH
+from src.results_cache import RESULT_CONSTANTS, RESULTS_CODE_FILES, get_code_fingerprint, get_dataframe_fingerprint
+from src.results_store import get_stored_upstream_fingerprint, get_upstream_fingerprint
+from src.write_latex_tables import TABLE_FAMILIES, write_groups_in_parallel
+
+CONSTANTS = get_constants()
+
+# The pipeline is ingest -> process -> results -> tables and plots. The processed data is cached by
+# `src.utils.get_all_data()` and the results by `src.results_store`, each with their own fingerprints. This module
+# handles the last step, and only writes the tables and plots whose inputs changed since they were last written.
+# The answer options in the nettskjema report are defined in `process_data.py`
+TABLE_CODE_FILES = ["make_latex_tables.py", "write_latex_tables.py", "process_data.py"]
+PLOT_CODE_FILES = ["make_plots.py"]
+PLOT_DEVICES = ["computer", "phone"]
+
+
+def _read_manifest():
+    """
+    Reads the fingerprints and paths of the outputs from the last runs.
+
+    Returns:
+        dict: Maps the name of each output to its "fingerprint" and "path". Empty if there is no manifest.
+    """
+    if not PIPELINE_MANIFEST_PATH.exists():
+        return {}
+    with open(PIPELINE_MANIFEST_PATH, "r") as infile:
+        try:
+            return json.load(infile)
+        except json.JSONDecodeError:  # A half written manifest. Everything is written again.
+            return {}
+
+
+def _write_manifest(manifest):
+    """
+    Writes the fingerprints and paths of the outputs, read by `_read_manifest()` in the next run.
+
+    Args:
+        manifest (dict): Maps the name of each output to its "fingerprint" and "path".
+    """
+    if not os.path.exists(CACHE_FOLDER):
+        os.makedirs(CACHE_FOLDER)
+    with open(PIPELINE_MANIFEST_PATH, "w") as outfile:
+        json.dump(manifest, outfile, indent=2)
+
+
+def _get_upstream_fingerprint(df):
+    """
+    Fingerprints what the tables are made from. This is the same with the data and with only the stored results (if
+    `df` is None), as long as the results are computed from the same data, so switching between them does not write
+    the tables again. See `src.results_store.get_upstream_fingerprint()`.
+    """
+    if df is not None:
+        return get_upstream_fingerprint(df)
+    return get_stored_upstream_fingerprint()
+
+
+def _get_captions(write_function):
+    """
+    Returns the captions a table function uses, found from the global names in its code, like
+    `SHAPIRO_WILK_MAIN_CAPTION`.
+    """
+    names = [name for name in write_function.__code__.co_names if name.endswith("_CAPTION")]
+    return [getattr(src.latex_table_captions, name) for name in names]
+
+
+def get_table_fingerprint(write_function, upstream_fingerprint):
+    """
+    Fingerprints everything a table depends on: the data or stored results, the constants changing the results, the
+    caption, the folders and the code making the results and the table.
+
+    Args:
+        write_function (callable): The function writing the table, from `src.write_latex_tables.TABLE_FAMILIES`.
+        upstream_fingerprint (str): Fingerprint of the data the results are computed from, see
+            `_get_upstream_fingerprint()`.
+
+    Returns:
+        str: Hex digest of the inputs.
+    """
+    hasher = hashlib.sha256()
+    hasher.update(upstream_fingerprint.encode())
+    hasher.update(write_function.__name__.encode())
+    hasher.update(repr(_get_captions(write_function)).encode())
+    hasher.update(repr([CONSTANTS[name] for name in RESULT_CONSTANTS]).encode())
+    hasher.update(repr(dict(CONSTANTS["paths"]["folders"])).encode())
+    hasher.update(get_code_fingerprint(tuple(RESULTS_CODE_FILES + TABLE_CODE_FILES)).encode())
+    return hasher.hexdigest()
+
+
+def get_plot_fingerprint(device, data_fingerprint):
+    """
+    Fingerprints everything a plot depends on: the data, the device, the paths and the plotting code.
+
+    Args:
+        device (str): The device the plot is for.
+        data_fingerprint (str): Fingerprint of the data, from `src.results_cache.get_dataframe_fingerprint()`.
+
+    Returns:
+        str: Hex digest of the inputs.
+    """
+    hasher = hashlib.sha256()
+    hasher.update(data_fingerprint.encode())
+    hasher.update(device.encode())
+    hasher.update(repr(dict(CONSTANTS["paths"]["folders"])).encode())
+    hasher.update(CONSTANTS["paths"]["filenames"][f"answer_times_line_plot_{device}"].encode())
+    hasher.update(get_code_fingerprint(tuple(PLOT_CODE_FILES)).encode())
+    return hasher.hexdigest()
+
+
+def _plot_response_times(df, device):
+    """
+    Plots the response times for one device, and returns the path of the plot.
+
+    Args:
+        df (pd.DataFrame): The dataframe with the data.
+        device (str): The device to plot, "computer" or "phone".
+
+    Returns:
+        Path: The path of the plot.
+    """
+    from src.make_plots import plot_response_times_per_device  # Only import matplotlib when plotting
+    return plot_response_times_per_device(df, device)
+
+
+def _get_nodes(df, stages):
+    """
+    Returns the tables and plots to make, as tuples with the name, the fingerprint, the family and a function making
+    the output from the dataframe and returning its path.
+    """
+    upstream_fingerprint = _get_upstream_fingerprint(df)
+    nodes = []
+    for family, write_functions in TABLE_FAMILIES.items():
+        if family not in stages:
+            continue
+        for write_function in write_functions:
+            fingerprint = get_table_fingerprint(write_function, upstream_fingerprint)
+            nodes.append((write_function.__name__, fingerprint, family, write_function))
+
+    if "plots" in stages:
+        data_fingerprint = get_dataframe_fingerprint(df)  # The plots are made from the data, not the results
+        for device in PLOT_DEVICES:
+            fingerprint = get_plot_fingerprint(device, data_fingerprint)
+            plot_function = functools.partial(_plot_response_times, device=device)
+            nodes.append((f"plot_response_times_{device}", fingerprint, "plots", plot_function))
+    return nodes
+
+
+def run_pipeline(df, stages, force=False, n_workers=None):
+    """
+    Writes the tables and plots for the chosen stages, but only the ones that are out of date. An output is out of
+    date if it does not exist, or if its data, results, constants, caption or code changed since it was written.
+
+    The outputs that are out of date are written one family at a time, and the families are written in parallel when
+    there are more than one worker, see `src.write_latex_tables.write_groups_in_parallel()`.
+
+    Args:
+        df (pd.DataFrame or None): The dataframe with the data. Get with `src.utils.get_all_data()`. If None, the
+            tables are rendered from the results store, and the stages needing the data can not be run.
+        stages (list of str): The table families in `src.write_latex_tables.TABLE_FAMILIES`, and "plots".
+        force (bool): If True, writes all the outputs, even the ones that are up to date.
+        n_workers (int or None): Worker processes for the families. If None, uses `CONSTANTS["n_table_workers"]`.
+
+    Returns:
+        dict: The paths of the outputs that were written under "written", and of those that were up to date under
+            "skipped".
+    """
+    unknown_stages = [stage for stage in stages if stage not in TABLE_FAMILIES and stage != "plots"]
+    if unknown_stages:
+        raise ValueError(f"Unknown stages {unknown_stages}. Must be in {list(TABLE_FAMILIES) + ['plots']}. ")
+
+    manifest = _read_manifest()
+    outputs = {"written": [], "skipped": []}
+    families = {}
+    for name, fingerprint, family, make_output in _get_nodes(df, stages):
+        previous = manifest.get(name)
+        is_up_to_date = (
+            previous is not None and previous["fingerprint"] == fingerprint and os.path.exists(previous["path"])
+        )
+        if is_up_to_date and not force:
+            outputs["skipped"].append(previous["path"])
+        else:
+            families.setdefault(family, []).append((name, fingerprint, make_output))
+
+    groups = [[make_output for _, _, make_output in nodes] for nodes in families.values()]
+    group_file_paths = write_groups_in_parallel(df, groups, n_workers=n_workers)
+    for nodes, file_paths in zip(families.values(), group_file_paths):
+        for (name, fingerprint, _), file_path in zip(nodes, file_paths):
+            manifest[name] = {"fingerprint": fingerprint, "path": str(file_path)}
+            outputs["written"].append(str(file_path))
+        _write_manifest(manifest)  # After each family, so the finished ones are kept if a later one fails
+    return outputs
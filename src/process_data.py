@@ -1,14 +1,22 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
 import numpy as np
 import pandas as pd
 import yaml
 
 from src.get_constants import get_constants
-from src.paths import QUALITATIVE_ANSWERS_FILENAME, get_experiment_results_path
+from src.paths import (CACHE_FOLDER, PARTICIPANT_CACHE_PATH, QUALITATIVE_ANSWERS_FILENAME, get_experiment_results_path,
+                       get_participant_numbers)
 
 CONSTANTS = get_constants()
 WEBSITES = CONSTANTS["websites"]
 DEVICES = CONSTANTS["devices"]
 
+# The libyaml loader is much faster, but is only available if PyYAML was built with libyaml
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
 
 def _quantisize_answers(text):
     """
@@ -49,11 +57,246 @@ def _get_experiment_results(participant_number):
         raise FileNotFoundError(f"File {file_path} not found. ")
 
     with open(file_path, "r") as infile:
-        results = yaml.safe_load(infile)
+        results = yaml.load(infile, Loader=YAML_LOADER)
     return results
 
 
-def process_participant_data():
+def _flatten_record(data, prefix=""):
+    """
+    Flattens nested dicts into one dict with the keys joined by ".", like `pd.json_normalize()` does. The keys are
+    also in the same order, with the values on each level before the flattened nested dicts.
+
+    Args:
+        data (dict): The nested dict.
+        prefix (str): Prefix for the keys, used in the recursion.
+
+    Returns:
+        dict: The flat dict.
+    """
+    record = {f"{prefix}{key}": value for key, value in data.items() if not isinstance(value, dict)}
+    for key, value in data.items():
+        if isinstance(value, dict):
+            record.update(_flatten_record(value, prefix=f"{prefix}{key}."))
+    return record
+
+
+def _read_experiment_results_record(participant_number):
+    """
+    Reads the experiment results of a participant as a flat dict. Module level, so it can be used in a process pool.
+    """
+    return _flatten_record(_get_experiment_results(participant_number=participant_number))
+
+
+def _read_experiment_results_records(participant_numbers):
+    """
+    Reads the experiment results of several participants as flat dicts. The files are parsed in a process pool when
+    there are more than one worker (`CONSTANTS["n_workers"]`, where 0 or None means all cores) and enough files.
+
+    Args:
+        participant_numbers (list of int): The participant numbers.
+
+    Returns:
+        list of dict: One flat dict per participant, in the same order as `participant_numbers`.
+    """
+    from src.utils import get_n_workers  # Imported here, since src.utils imports this module
+    n_workers = min(get_n_workers(), len(participant_numbers))
+    if n_workers <= 1:
+        return [_read_experiment_results_record(participant_number) for participant_number in participant_numbers]
+
+    chunksize = max(1, len(participant_numbers) // (4 * n_workers))
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        return list(executor.map(_read_experiment_results_record, participant_numbers, chunksize=chunksize))
+
+
+def _records_to_dataframe(records):
+    """
+    Makes a dataframe from flat dicts, with the columns in the order they first appear and NaN where a record is
+    missing a column. Gives the same as concatenating `pd.json_normalize()` of each record, without making one
+    dataframe per record.
+
+    Args:
+        records (list of dict): The flat dicts, one per row.
+
+    Returns:
+        pd.DataFrame: The dataframe.
+    """
+    columns = {}
+    for i, record in enumerate(records):
+        for key, value in record.items():
+            if key not in columns:
+                columns[key] = [np.nan] * len(records)
+            columns[key][i] = value
+    return pd.DataFrame(columns, index=pd.RangeIndex(len(records)))
+
+
+def _to_answer_categories(values, answer_options, missing):
+    """
+    Turns the answers to a question into an ordered categorical, with the answer options in the order they are
+    presented in. Answers that are not among the options are added as categories after them, so no answers are lost.
+
+    Args:
+        values (pd.Series): The answers, as strings.
+        answer_options (list of str): The answer options of the question.
+        missing (pd.Series): Boolean series, True where the answer is missing.
+
+    Returns:
+        pd.Series: The answers as an ordered categorical, with NaN for missing answers.
+    """
+    values = values.mask(missing)
+    unseen_values = sorted(set(values.dropna().unique()) - set(answer_options))
+    categories = pd.CategoricalDtype(list(answer_options) + unseen_values, ordered=True)
+    return values.astype(categories)
+
+
+def _downcast_integer_columns(df, columns):
+    """
+    Stores columns that only have whole numbers, and no missing values, as int16 instead of int64 or float64. This
+    does not change any values or the results of `mean()`, `std()` and `sum()`, since pandas and numpy compute them
+    with 64 bit accumulators for integer columns.
+
+    Columns with missing values or with values outside the int16 range are left as they are. int16, and not int8,
+    leaves room for sums of a few columns without overflowing.
+
+    Args:
+        df (pd.DataFrame): The dataframe. Changed in place.
+        columns (list of str): The columns to downcast if possible.
+    """
+    int16_info = np.iinfo(np.int16)
+    for column in columns:
+        values = df[column]
+        if values.dtype.kind not in "iuf" or values.isna().any():
+            continue
+        if not (values % 1 == 0).all() or values.min() < int16_info.min or values.max() > int16_info.max:
+            continue
+        df[column] = values.astype(np.int16)
+
+
+def _get_file_fingerprint(file_path):
+    """
+    Returns the size and modification time of a file, or None if it does not exist.
+    """
+    file_path = Path(file_path)
+    if not file_path.exists():
+        return None
+    stat = file_path.stat()
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _read_participant_cache():
+    """
+    Reads the cache of parsed participant files.
+
+    Returns:
+        dict: Dict from file paths to dicts with the "fingerprint" of the file and the parsed "record".
+    """
+    if not PARTICIPANT_CACHE_PATH.exists():
+        return {}
+    try:
+        return pd.read_pickle(PARTICIPANT_CACHE_PATH)
+    except Exception:  # A broken cache is parsed again
+        return {}
+
+
+def _write_participant_cache(participant_cache):
+    """
+    Writes the cache of parsed participant files.
+
+    Args:
+        participant_cache (dict): Dict from file paths to dicts with the "fingerprint" of the file and the parsed
+            "record".
+    """
+    if not os.path.exists(CACHE_FOLDER):
+        os.makedirs(CACHE_FOLDER)
+    pd.to_pickle(participant_cache, PARTICIPANT_CACHE_PATH)
+
+
+def _get_cached_records(participant_numbers, participant_cache):
+    """
+    Returns the experiment results of the participants as flat dicts. The files that have not changed (by size or
+    modification time) since they were parsed are taken from the cache, and the new and changed files are parsed, all
+    at once so they can be parsed in parallel, and added to the cache.
+
+    Args:
+        participant_numbers (list of int): The participant numbers.
+        participant_cache (dict): The cache from `_read_participant_cache()`. Changed in place.
+
+    Returns:
+        (list of dict, bool): The flat dicts, in the same order as `participant_numbers`, and whether any files were
+            parsed.
+    """
+    file_paths = [
+        str(get_experiment_results_path(participant_number=participant_number))
+        for participant_number in participant_numbers
+    ]
+    fingerprints = [_get_file_fingerprint(file_path) for file_path in file_paths]
+
+    changed = []
+    for i, file_path in enumerate(file_paths):
+        cached = participant_cache.get(file_path)
+        if cached is None or cached["fingerprint"] != fingerprints[i] or "record" not in cached:
+            changed.append(i)
+    records = _read_experiment_results_records([participant_numbers[i] for i in changed])
+    for i, record in zip(changed, records):
+        participant_cache[file_paths[i]] = {"fingerprint": fingerprints[i], "record": record}
+
+    return [participant_cache[file_path]["record"] for file_path in file_paths], len(changed) > 0
+
+
+def _prune_participant_cache(participant_cache, file_paths=()):
+    """
+    Removes the participants that have been removed or renamed from the cache. They are found from all the
+    participant files, since the participants read may only be some of them.
+
+    Args:
+        participant_cache (dict): The cache from `_read_participant_cache()`. Changed in place.
+        file_paths (list of str): Files to keep in the cache even if they are not in the data folder.
+
+    Returns:
+        bool: Whether any participants were removed.
+    """
+    existing_file_paths = {
+        str(get_experiment_results_path(participant_number=participant_number))
+        for participant_number in get_participant_numbers()
+    }
+    stale_file_paths = [
+        file_path for file_path in participant_cache
+        if file_path not in existing_file_paths and file_path not in file_paths
+    ]
+    for file_path in stale_file_paths:
+        del participant_cache[file_path]
+    return len(stale_file_paths) > 0
+
+
+def _read_all_experiment_results(participant_numbers, use_cache=True):
+    """
+    Reads the experiment results of the participants into a dataframe, with one row per participant.
+
+    With the cache, only the files that are new or have changed (by size or modification time) since the last run
+    are parsed, and the rest are reused from the cache. Cached files of participants that are no longer in the data
+    folder are removed from the cache.
+
+    Args:
+        participant_numbers (list of int): The participant numbers.
+        use_cache (bool): Whether or not to use the cache of parsed participant files.
+
+    Returns:
+        pd.DataFrame: The experiment results.
+    """
+    participant_cache = _read_participant_cache() if use_cache else {}
+    records, is_changed = _get_cached_records(participant_numbers, participant_cache)
+    file_paths = [
+        str(get_experiment_results_path(participant_number=participant_number))
+        for participant_number in participant_numbers
+    ]
+    is_pruned = _prune_participant_cache(participant_cache, file_paths=file_paths)
+
+    if use_cache and (is_changed or is_pruned):
+        _write_participant_cache(participant_cache)
+
+    return _records_to_dataframe(records)
+
+
+def process_participant_data(participant_numbers=None, use_cache=True):
     """
     Processes the data that is collected from the observational study and writes to csv.
 
@@ -62,41 +305,84 @@ def process_participant_data():
 
     Then, the number of accepts per participant and website is quantified as an int (instead of string).
 
+    Args:
+        participant_numbers (list of int or None): The participants to read. If None, reads all the participant
+            folders in the data folder.
+        use_cache (bool): Whether or not to reuse parsed participant files that have not changed since the last run.
+
     Returns:
         pd.DataFrame: The dataframe with the participants data from the observational study.
     """
     # First, read the data from the yaml files into a pandas dataframe.
-    n_participants = CONSTANTS["number_of_participants"]
-    all_data = []
+    if participant_numbers is None:
+        participant_numbers = get_participant_numbers()
+    df = _read_all_experiment_results(participant_numbers, use_cache=use_cache)
+    return _process_experiment_results(df)
 
-    for participant_number in range(1, n_participants + 1):
-        data = _get_experiment_results(participant_number=participant_number)
-        all_data.append(pd.json_normalize(data))
-    df = pd.concat(all_data, ignore_index=True)
 
-    # Now process the data further. Quantify the number of accepts per websites and the time spent answering banners.
-    df["computer_accepts"] = 0
-    df["phone_accepts"] = 0
-    df["computer_average_time"] = 0
-    df["phone_average_time"] = 0
+def process_participant_data_in_chunks(chunk_size, use_cache=True):
+    """
+    Processes the data from the observational study like `process_participant_data()`, one chunk of participants at
+    a time, so only one chunk of the dataframe is in memory. The cache of parsed participant files is read and
+    written once, and not once per chunk.
 
-    for website in WEBSITES:
-        df[f"{website}_accepts_int"] = 0
-        df[f"{website}_average_time"] = 0
+    Args:
+        chunk_size (int): Participants per chunk.
+        use_cache (bool): Whether or not to reuse parsed participant files that have not changed since the last run.
 
-    for device in DEVICES:
-        for website in WEBSITES:
-            df[f"{device}.{website}.answer.int"] = df[f"{device}.{website}.answer"].apply(_quantisize_answers)
-            df[f"{device}_accepts"] += df[f"{device}.{website}.answer.int"]
-            df[f"{website}_accepts_int"] += df[f"{device}.{website}.answer.int"]
-            df[f"{device}_average_time"] += df[f"{device}.{website}.time"]
-            df[f"{website}_average_time"] += df[f"{device}.{website}.time"]
+    Yields:
+        pd.DataFrame: The processed data of each chunk, with the participants in the order of
+            `get_participant_numbers()`.
+    """
+    participant_numbers = get_participant_numbers()
+    participant_cache = _read_participant_cache() if use_cache else {}
+    is_changed = False
+    for start in range(0, len(participant_numbers), chunk_size):
+        # Without the cache, the records of each chunk are dropped after the chunk
+        records, is_chunk_changed = _get_cached_records(
+            participant_numbers[start:start + chunk_size], participant_cache if use_cache else {}
+        )
+        is_changed = is_changed or is_chunk_changed
+        yield _process_experiment_results(_records_to_dataframe(records))
+
+    if use_cache and (_prune_participant_cache(participant_cache) or is_changed):
+        _write_participant_cache(participant_cache)
+
+
+def _process_experiment_results(df):
+    """
+    Adds the accepts as ints, the average times and the average withdrawal times to the experiment results, see
+    `process_participant_data()`.
+
+    Args:
+        df (pd.DataFrame): The experiment results, from `_read_all_experiment_results()`.
 
-    df["total_accepts"] = df["computer_accepts"] + df["phone_accepts"]
+    Returns:
+        pd.DataFrame: The processed experiment results.
+    """
+    # Now process the data further. Quantify the number of accepts per websites and the time spent answering banners.
+    # The new columns are made first and added with one concat, so the dataframe is not fragmented.
+    answer_ints = {
+        (device, website): df[f"{device}.{website}.answer"].apply(_quantisize_answers)
+        for device in DEVICES for website in WEBSITES
+    }
+    times = {(device, website): df[f"{device}.{website}.time"] for device in DEVICES for website in WEBSITES}
+
+    new_columns = {}
+    for device in ["computer", "phone"]:
+        new_columns[f"{device}_accepts"] = sum(answer_ints[(device, website)] for website in WEBSITES)
+    for device in ["computer", "phone"]:
+        new_columns[f"{device}_average_time"] = sum(times[(device, website)] for website in WEBSITES) / len(WEBSITES)
+    for website in WEBSITES:
+        new_columns[f"{website}_accepts_int"] = sum(answer_ints[(device, website)] for device in DEVICES)
+        new_columns[f"{website}_average_time"] = sum(times[(device, website)] for device in DEVICES)
+    for (device, website), answer_int in answer_ints.items():
+        new_columns[f"{device}.{website}.answer.int"] = answer_int
 
-    df["computer_average_time"] = df["computer_average_time"] / len(WEBSITES)
-    df["phone_average_time"] = df["phone_average_time"] / len(WEBSITES)
-    df["total_average_time"] = (df["computer_average_time"] + df["phone_average_time"]) / 2
+    new_columns["total_accepts"] = new_columns["computer_accepts"] + new_columns["phone_accepts"]
+    new_columns["total_average_time"] = (
+        new_columns["computer_average_time"] + new_columns["phone_average_time"]
+    ) / 2
 
     # Make average withdrawal and consent column per participant
     withdrawal_column_names = []
@@ -111,32 +397,93 @@ def process_participant_data():
                     "answer": f"{device}.{website}.time"
                 })
 
-    average_withdrawal_times = []
-    average_consent_given_withdrawal_times = []
-
-    for _, row in df.iterrows():
-        withdrawal_times = []
-        consent_times = []
+    # Average over the withdrawal slots (columns) that are not missing, for all participants (rows) at once
+    withdrawal_times = df[[names["withdraw"] for names in withdrawal_column_names]].to_numpy(dtype=float)
+    consent_times = df[[names["answer"] for names in withdrawal_column_names]].to_numpy(dtype=float)
+    has_withdrawn = ~np.isnan(withdrawal_times)
+    n_withdrawals = has_withdrawn.sum(axis=1)
+
+    # Consent times are only counted for the slots with a withdrawal, but are still NaN if missing there
+    with np.errstate(divide="ignore", invalid="ignore"):
+        average_withdrawal_times = np.where(has_withdrawn, withdrawal_times, 0).sum(axis=1) / n_withdrawals
+        average_consent_given_withdrawal_times = np.where(has_withdrawn, consent_times, 0).sum(axis=1) / n_withdrawals
+    average_withdrawal_times[n_withdrawals == 0] = np.nan
+    average_consent_given_withdrawal_times[n_withdrawals == 0] = np.nan
+
+    new_columns["average_withdrawal_times"] = pd.Series(average_withdrawal_times, index=df.index)
+    new_columns["average_consent_given_withdrawal_times"] = pd.Series(
+        average_consent_given_withdrawal_times, index=df.index
+    )
+    df = pd.concat([df, pd.DataFrame(new_columns, index=df.index)], axis=1)
+
+    # Store the accepts compactly. The times are kept as float64, since float32 would change the values.
+    accept_columns = [f"{device}.{website}.answer.int" for device in DEVICES for website in WEBSITES]
+    accept_columns += [f"{website}_accepts_int" for website in WEBSITES]
+    accept_columns += ["computer_accepts", "phone_accepts", "total_accepts"]
+    _downcast_integer_columns(df, accept_columns)
 
-        for column_name_dict in withdrawal_column_names:
-            withdrawal_column_name = column_name_dict["withdraw"]
-            consent_column_name = column_name_dict["answer"]
-
-            if not pd.isna(row[withdrawal_column_name]):
-                withdrawal_times.append(row[withdrawal_column_name])
-                consent_times.append(row[consent_column_name])
+    return df
 
-        if withdrawal_times != []:
-            average_withdrawal_times.append(np.mean(withdrawal_times))
-            average_consent_given_withdrawal_times.append(np.mean(consent_times))
-        else:
-            average_withdrawal_times.append(np.nan)
-            average_consent_given_withdrawal_times.append(np.nan)
 
-    df["average_withdrawal_times"] = average_withdrawal_times
-    df["average_consent_given_withdrawal_times"] = average_consent_given_withdrawal_times
+def get_nettskjema_answer_options():
+    """
+    Returns the answers options for the nettskjema questions, as values in a dict where the
+    keys are the columns for the respective questions.
 
-    return df
+    Returns:
+        dict: The answer options.
+    """
+    all_nettskjema_answer_options = {
+        "privacy_concern": [
+            "Very concerned",
+            "Quite concerned",
+            "Slightly concerned",
+            "Don't know",
+        ],
+        "knows_cookies": [
+            "Yes",
+            "No",
+        ],
+        "understand_cookie_consent": [
+            "To a great extent",
+            "To some extent",
+            "Neither nor",
+            "To a small extent",
+            "Not at all",
+            "Don't know",
+        ],
+        "cookie_sharing_feeling": [
+            "I want as little information as possible about me and my online activity to be saved and shared.",
+            "I want information about me and my online activity to be saved and shared, "
+            "since it improves my user experience.",
+            "I am indifferent to my information and online activity being saved and shared.",
+            "Don't know",
+        ],
+        "cookie_banner_response": [
+            "I ignore them and leave them open.",
+            "I choose the easiest option, whether it's accept or decline.",
+            "I try to decline when possible, but accept if rejecting is too much effort.",
+            "I actively take steps to withhold my consent.",
+            "I consent because it improves my user experience.",
+            "Don't know",
+        ],
+        "have_withdrawn_consent": ["Yes", "No", "Don't know"],
+        "aware_withdrawal_ease": ["Yes", "No", "Don't know"],
+        "age": [
+            "15 - 19 years",
+            "20 - 29 years",
+            "30 - 39 years",
+            "40 - 49 years",
+            "50 - 59 years",
+            "60+ years",
+        ],
+        "it_background": [
+            "Yes, programming and/or design related",
+            "Yes, other",
+            "No",
+        ],
+    }
+    return all_nettskjema_answer_options
 
 
 def process_nettskjema_data(df):
@@ -145,6 +492,7 @@ def process_nettskjema_data(df):
     Calculates a score based on the cookie answers.
     Makes a quantitative version of the Likert answers.
     Make int version of the ages.
+    Stores the answers to the questions with answer options as ordered categoricals.
 
     Args:
         df (pd.DataFrame): Pandas dataframe with the nettskjema data.
@@ -160,19 +508,9 @@ def process_nettskjema_data(df):
     correct_cookie_answers = CONSTANTS["correct_cookie_answers"]
     wrong_cookie_answers = CONSTANTS["wrong_cookie_answers"]
 
-    df["cookie_questions_correct"] = 0
-    df["cookie_questions_wrong"] = 0
-
-    for correct_cookie_answer in correct_cookie_answers:
-        not_checked = df[correct_cookie_answer].isna()
-        for i in range(len(df)):
-            if not not_checked[i]:
-                df.loc[i, "cookie_questions_correct"] += 1
-    for wrong_cookie_answer in wrong_cookie_answers:
-        not_checked = df[wrong_cookie_answer].isna()
-        for i in range(len(df)):
-            if not not_checked[i]:
-                df.loc[i, "cookie_questions_wrong"] += 1
+    # An answer is checked if it is not missing, so count the checked answers per row
+    df["cookie_questions_correct"] = df[list(correct_cookie_answers)].notna().sum(axis=1)
+    df["cookie_questions_wrong"] = df[list(wrong_cookie_answers)].notna().sum(axis=1)
 
     df["cookie_questions_score"] = df["cookie_questions_correct"] - df["cookie_questions_wrong"]
 
@@ -186,17 +524,30 @@ def process_nettskjema_data(df):
     df["age"] = df["age"].str.strip()  # Remove trailing whitespace
     df["age_int"] = df["age"].map(age_mapping)
 
-    # Remove trailing whitespaces and wrongly encoded unicode characters (from UiO Nettskjema)
-    for column in column_names.values():
-        if column == "submission_id":
-            continue
-        df[column] = (
-            df[column]
-            .astype(str)
-            .str.strip()
-            .str.replace("&#43;", "+", regex=False)
-            .str.replace("&#39;", "'", regex=False)
-        )
+    # Remove trailing whitespaces and wrongly encoded unicode characters (from UiO Nettskjema).
+    # All the columns are stacked into one series, so the cleaning is done in one pass instead of once per column.
+    text_columns = [column for column in column_names.values() if column != "submission_id"]
+    missing = df[text_columns].isna()
+    cleaned = (
+        pd.concat([df[column].astype(str) for column in text_columns], ignore_index=True)
+        .str.strip()
+        .str.replace("&#43;", "+", regex=False)
+        .str.replace("&#39;", "'", regex=False)
+    )
+    n_rows = len(df)
+    for i, column in enumerate(text_columns):
+        df[column] = cleaned.iloc[i * n_rows:(i + 1) * n_rows].set_axis(df.index)
+
+    # Questions with answer options are stored as ordered categoricals, with missing answers as NaN instead of "nan".
+    # The free text answers are kept as strings.
+    for column, answer_options in get_nettskjema_answer_options().items():
+        df[column] = _to_answer_categories(df[column], answer_options, missing=missing[column])
+
+    integer_columns = [
+        "cookie_questions_correct", "cookie_questions_wrong", "cookie_questions_score", "understand_cookie_consent_int",
+        "age_int",
+    ]
+    _downcast_integer_columns(df, integer_columns)
 
     return df
 
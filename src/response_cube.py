@@ -0,0 +1,412 @@
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src.get_constants import get_constants
+from src.results_cache import get_dataframe_fingerprint
+
+CONSTANTS = get_constants()
+WEBSITES = CONSTANTS["websites"]
+DEVICES = CONSTANTS["devices"]
+
+RESPONSE_VARIABLES = ["accepts", "time", "withdrawal_time"]
+STATISTICS = ["sum", "count", "mean", "std"]
+
+# The columns of the wide dataframe with the values of each variable
+COLUMN_FORMATS = {
+    "accepts": "{device}.{website}.answer.int",
+    "time": "{device}.{website}.time",
+    "withdrawal_time": "Withdraw.{device}.{website}.time",
+}
+
+# The fingerprint of the last dataframe passed to `get_dataframe_cube()`, and its cube
+_dataframe_cube = (None, None)
+
+
+def nansum(values):
+    """
+    Sums over the last axis, skipping NaN. Gives the same as `pd.Series.sum()` for each slice along the last axis.
+
+    Args:
+        values (np.ndarray): The values.
+
+    Returns:
+        np.ndarray: The sums, with the last axis removed.
+    """
+    return np.where(np.isnan(values), 0, values).sum(axis=-1)
+
+
+def nancount(values):
+    """
+    Counts the values that are not NaN over the last axis, like `pd.Series.count()`.
+    """
+    return (~np.isnan(values)).sum(axis=-1)
+
+
+def nanmean(values):
+    """
+    Means over the last axis, skipping NaN. Uses the same steps as pandas, so that the results are exactly the same as
+    `pd.Series.mean()` on each slice along the last axis, when the last axis is contiguous.
+
+    Args:
+        values (np.ndarray): The values.
+
+    Returns:
+        np.ndarray: The means, with the last axis removed. NaN where there are no values.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return nansum(values) / nancount(values)
+
+
+def nanstd(values, ddof=1):
+    """
+    Standard deviations over the last axis, skipping NaN. Uses the same steps as pandas, so that the results are
+    exactly the same as `pd.Series.std()` on each slice along the last axis, when the last axis is contiguous.
+
+    Args:
+        values (np.ndarray): The values.
+        ddof (int): Delta degrees of freedom.
+
+    Returns:
+        np.ndarray: The standard deviations, with the last axis removed. NaN where there are too few values.
+    """
+    missing = np.isnan(values)
+    filled = np.where(missing, 0, values)
+    counts = (~missing).sum(axis=-1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        means = filled.sum(axis=-1) / counts
+        squares = (means[..., None] - filled) ** 2
+        squares[missing] = 0
+        variances = squares.sum(axis=-1) / (counts - ddof)
+    variances = np.where(counts - ddof > 0, variances, np.nan)
+    return np.sqrt(variances)
+
+
+def get_dataframe_values(df):
+    """
+    Returns the values of the cube variables in a wide dataframe, with columns like "computer.dnb.answer.int",
+    "computer.dnb.time" and "Withdraw.computer.dnb.time". Withdrawal columns that do not exist (nobody withdrew) are
+    NaN.
+
+    Args:
+        df (pd.DataFrame): The data, or some of the rows of it.
+
+    Returns:
+        dict: Maps each variable in `RESPONSE_VARIABLES` to an array of shape (devices, websites, rows), which is the
+            memory layout of the cube.
+    """
+    arrays = {}
+    for variable, column_format in COLUMN_FORMATS.items():
+        values = np.full((len(DEVICES), len(WEBSITES), len(df)), np.nan)
+        for i, device in enumerate(DEVICES):
+            for j, website in enumerate(WEBSITES):
+                column = column_format.format(device=device, website=website)
+                if column in df.columns:
+                    values[i, j] = df[column].to_numpy(dtype=np.float64)
+        arrays[variable] = values
+    return arrays
+
+
+def write_dataframe_chunks(file_paths, chunks, n_rows):
+    """
+    Writes the values of the cube variables in chunks of a wide dataframe into `.npy` files, in the memory layout of
+    the cube. The files are memory-mapped, so only one chunk is in memory at a time.
+
+    Args:
+        file_paths (dict): Maps each variable in `RESPONSE_VARIABLES` to the `.npy` file to write.
+        chunks (iterable of pd.DataFrame): The chunks of rows, in order. See `get_dataframe_values()`.
+        n_rows (int): The number of rows in all the chunks together.
+
+    Raises:
+        ValueError: If the chunks do not have `n_rows` rows together.
+    """
+    shape = (len(DEVICES), len(WEBSITES), n_rows)
+    arrays = {
+        variable: np.lib.format.open_memmap(file_path, mode="w+", dtype=np.float64, shape=shape)
+        for variable, file_path in file_paths.items()
+    }
+    start = 0
+    for chunk in chunks:
+        for variable, values in get_dataframe_values(chunk).items():
+            arrays[variable][:, :, start:start + len(chunk)] = values
+        start += len(chunk)
+    if start != n_rows:
+        raise ValueError(f"The chunks have {start} rows, but {n_rows} were expected. ")
+    for values in arrays.values():
+        values.flush()
+
+
+def write_axes(folder, participants):
+    """
+    Writes the devices, websites and participants of a cube saved in `folder`, read by `ResponseCube.load()`.
+
+    Args:
+        folder (Path): The folder the cube is saved in.
+        participants (pd.Index): The labels of the participants.
+    """
+    with open(folder / "axes.json", "w") as outfile:
+        json.dump({"devices": DEVICES, "websites": WEBSITES, "participants": participants.tolist()}, outfile)
+
+
+def _get_moments(values):
+    """
+    Finds the counts, means and sums of squared deviations from the means over the last axis, skipping NaN.
+    """
+    missing = np.isnan(values)
+    counts = (~missing).sum(axis=-1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        means = np.where(missing, 0, values).sum(axis=-1) / counts
+    squares = np.where(missing, 0, (values - means[..., None]) ** 2)
+    return counts, np.where(counts > 0, means, 0), squares.sum(axis=-1)
+
+
+def _merge_moments(moments1, moments2):
+    """
+    Merges the moments of two chunks of values, with the parallel algorithm of Chan et al., so the mean and variance
+    of all the values can be found one chunk at a time.
+    """
+    counts1, means1, squares1 = moments1
+    counts2, means2, squares2 = moments2
+    counts = counts1 + counts2
+    deltas = means2 - means1
+    with np.errstate(divide="ignore", invalid="ignore"):
+        means = np.where(counts > 0, means1 + deltas * counts2 / counts, 0)
+        squares = squares1 + squares2 + np.where(counts > 0, deltas ** 2 * counts1 * counts2 / counts, 0)
+    return counts, means, squares
+
+
+class ResponseCube:
+    """
+    The responses to the cookie banners in the observational study, as arrays with one value per participant, device
+    and website, for the accepts (1 for accept, 0 for reject, NaN if neither), the answer times and the withdrawal
+    times (NaN if the consent was not withdrawn).
+
+    The arrays have the shape (participants, devices, websites), with the devices and websites in the order from
+    `constants.yaml`. In memory, the participants are the innermost axis, so one device and website is contiguous, and
+    reductions over the participants give exactly the same as the pandas columns they were made from.
+
+    The cube can be saved as `.npy` files and loaded memory-mapped with `save()` and `load()`. `reduce()` goes through
+    the participants in chunks, so a memory-mapped cube does not need to fit in memory.
+    """
+
+    def __init__(self, accepts, times, withdrawal_times, participants=None):
+        """
+        Args:
+            accepts (np.ndarray): Accepts, shape (participants, devices, websites).
+            times (np.ndarray): Answer times, shape (participants, devices, websites).
+            withdrawal_times (np.ndarray): Withdrawal times, shape (participants, devices, websites).
+            participants (pd.Index or None): The labels of the participants. If None, uses 0, 1, 2, ...
+        """
+        self._data = {}
+        for variable, values in zip(RESPONSE_VARIABLES, [accepts, times, withdrawal_times]):
+            values = np.asarray(values, dtype=np.float64)
+            if values.shape[1:] != (len(DEVICES), len(WEBSITES)):
+                raise ValueError(
+                    f"Expected {variable} with shape (participants, {len(DEVICES)}, {len(WEBSITES)}). "
+                    f"Was {values.shape}. "
+                )
+            # Stored as (devices, websites, participants), see the class docstring
+            self._data[variable] = np.ascontiguousarray(np.moveaxis(values, 0, -1))
+
+        n_participants = self._data["accepts"].shape[-1]
+        self.participants = pd.RangeIndex(n_participants) if participants is None else pd.Index(participants)
+
+    @classmethod
+    def from_dataframe(cls, df):
+        """
+        Makes the cube from the wide dataframe, see `get_dataframe_values()`.
+
+        Args:
+            df (pd.DataFrame): The data. Get with `src.utils.get_all_data()`.
+
+        Returns:
+            ResponseCube: The cube.
+        """
+        arrays = {variable: np.moveaxis(values, -1, 0) for variable, values in get_dataframe_values(df).items()}
+        return cls(arrays["accepts"], arrays["time"], arrays["withdrawal_time"], participants=df.index)
+
+    def save(self, folder):
+        """
+        Saves the cube as one `.npy` file per variable, in the memory layout of the cube, so that it can be loaded
+        memory-mapped with `load()`.
+
+        Args:
+            folder (Path or str): The folder to save in.
+        """
+        folder = Path(folder)
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        for variable in RESPONSE_VARIABLES:
+            np.save(folder / f"{variable}.npy", self._data[variable])
+        write_axes(folder, self.participants)
+
+    @classmethod
+    def load(cls, folder, mmap_mode="r"):
+        """
+        Loads a cube saved with `save()`.
+
+        Args:
+            folder (Path or str): The folder the cube is saved in.
+            mmap_mode (str or None): Memory-map mode for `np.load()`. With "r", the arrays are read from disk when
+                they are used instead of being loaded into memory. None loads them into memory.
+
+        Raises:
+            ValueError: If the cube was saved with other devices or websites than in `constants.yaml`.
+
+        Returns:
+            ResponseCube: The cube.
+        """
+        folder = Path(folder)
+        with open(folder / "axes.json", "r") as infile:
+            axes = json.load(infile)
+        if axes["devices"] != list(DEVICES) or axes["websites"] != list(WEBSITES):
+            raise ValueError(f"The cube in {folder} has other devices or websites than in constants.yaml. ")
+
+        cube = cls.__new__(cls)
+        cube._data = {
+            variable: np.load(folder / f"{variable}.npy", mmap_mode=mmap_mode) for variable in RESPONSE_VARIABLES
+        }
+        cube.participants = pd.Index(axes["participants"])
+        return cube
+
+    def __len__(self):
+        return len(self.participants)
+
+    @property
+    def accepts(self):
+        return np.moveaxis(self._data["accepts"], -1, 0)
+
+    @property
+    def times(self):
+        return np.moveaxis(self._data["time"], -1, 0)
+
+    @property
+    def withdrawal_times(self):
+        return np.moveaxis(self._data["withdrawal_time"], -1, 0)
+
+    def get_values(self, variable, device, participants=slice(None)):
+        """
+        Returns the values for one device, or for both devices combined, with the participants on the last axis.
+
+        Args:
+            variable (str): "accepts", "time" or "withdrawal_time".
+            device (str): A device from `constants.yaml`, or "both". For "both" the devices are summed, like the
+                "{website}_accepts_int" and "{website}_average_time" columns.
+            participants (slice): The participants (by position) to get the values for. Defaults to all.
+
+        Returns:
+            np.ndarray: Array of shape (websites, participants). A view for a single device.
+        """
+        if variable not in RESPONSE_VARIABLES:
+            raise ValueError(f"Argument `variable` must be in {RESPONSE_VARIABLES}. Was {variable}. ")
+        if device == "both":
+            return self._data[variable][:, :, participants].sum(axis=0)
+        if device not in DEVICES:
+            raise ValueError(f"Argument `device` must be in {[*DEVICES, 'both']}. Was {device}. ")
+        return self._data[variable][DEVICES.index(device), :, participants]
+
+    def reduce(self, statistic, variable, device, all_websites=False, consented_only=False, chunk_size=None):
+        """
+        Finds a statistic over the participants, for each website or for all websites together. Missing values are
+        skipped, like in pandas.
+
+        The participants are reduced in chunks of `chunk_size`, so the whole cube never has to be in memory. When
+        there is only one chunk, the results are exactly the same as from pandas, and with more chunks they agree up
+        to floating point rounding.
+
+        Args:
+            statistic (str): "sum", "count", "mean" or "std".
+            variable (str): "accepts", "time" or "withdrawal_time".
+            device (str): A device from `constants.yaml`, or "both".
+            all_websites (bool): If True, reduces over all the websites together, like when the website columns are
+                concatenated.
+            consented_only (bool): If True, only uses the values where the participant accepted.
+            chunk_size (int or None): Participants per chunk. If None, uses `CONSTANTS["response_cube_chunk_size"]`.
+
+        Returns:
+            np.ndarray: The statistic, shape (websites,), or (1,) if `all_websites`.
+        """
+        if statistic not in STATISTICS:
+            raise ValueError(f"Argument `statistic` must be in {STATISTICS}. Was {statistic}. ")
+        if chunk_size is None:
+            chunk_size = CONSTANTS["response_cube_chunk_size"]
+
+        def get_chunk(participants):
+            values = self.get_values(variable, device, participants=participants)
+            if consented_only:
+                values = np.where(self.get_values("accepts", device, participants=participants) == 1, values, np.nan)
+            return values.reshape(1, -1) if all_websites else values
+
+        n_participants = len(self)
+        if n_participants <= chunk_size:  # Exactly like pandas
+            values = get_chunk(slice(None))
+            reductions = {"sum": nansum, "count": nancount, "mean": nanmean, "std": nanstd}
+            return reductions[statistic](values)
+
+        sums = 0
+        moments = None
+        for start in range(0, n_participants, chunk_size):
+            values = get_chunk(slice(start, start + chunk_size))
+            sums = sums + nansum(values)  # Summed separately, so sums of whole numbers stay exact
+            chunk_moments = _get_moments(values)
+            moments = chunk_moments if moments is None else _merge_moments(moments, chunk_moments)
+        counts, means, squares = moments
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            if statistic == "sum":
+                return sums
+            if statistic == "count":
+                return counts
+            if statistic == "mean":
+                return np.where(counts > 0, means, np.nan)
+            return np.sqrt(np.where(counts > 1, squares / (counts - 1), np.nan))
+
+    def to_frame(self, variable, device):
+        """
+        Returns the values for one device, or for both devices combined, as a dataframe with one column per website
+        and one row per participant. For a single device the dataframe is a view of the cube, without copying.
+
+        Args:
+            variable (str): "accepts", "time" or "withdrawal_time".
+            device (str): A device from `constants.yaml`, or "both".
+
+        Returns:
+            pd.DataFrame: The values.
+        """
+        values = self.get_values(variable, device)
+        return pd.DataFrame(values.T, index=self.participants, columns=WEBSITES, copy=False)
+
+
+def get_dataframe_cube(df):
+    """
+    Returns the response cube of a dataframe, see `ResponseCube.from_dataframe()`. The cube of the last dataframe is
+    kept, keyed on the fingerprint of its contents, so all the tests and statistics on the same data share one cube
+    instead of making their own.
+
+    Args:
+        df (pd.DataFrame): The data. Get with `src.utils.get_all_data()`.
+
+    Returns:
+        ResponseCube: The cube. Should not be changed, since it is shared.
+    """
+    global _dataframe_cube
+    fingerprint = get_dataframe_fingerprint(df)
+    if _dataframe_cube[0] != fingerprint:
+        _dataframe_cube = (fingerprint, ResponseCube.from_dataframe(df))
+    return _dataframe_cube[1]
+
+
+def set_dataframe_cube(df, cube):
+    """
+    Sets the cube returned by `get_dataframe_cube()` for a dataframe, for instance a memory-mapped cube from
+    `src.utils.get_response_cube()` for the data it was made from.
+
+    Args:
+        df (pd.DataFrame): The data.
+        cube (ResponseCube): The responses in `df`.
+    """
+    global _dataframe_cube
+    _dataframe_cube = (get_dataframe_fingerprint(df), cube)
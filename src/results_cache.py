@@ -0,0 +1,152 @@
+import copy
+import functools
+import hashlib
+import inspect
+import weakref
+from pathlib import Path
+
+import pandas as pd
+
+from src.get_constants import get_constants
+
+CONSTANTS = get_constants()
+
+# Constants that change the results of the tests, and therefore are part of the cache keys
+RESULT_CONSTANTS = ["random_state", "n_bootstraps", "n_permutations", "wilcoxon_exact_max_n"]
+
+# The source files (in `src/`) computing the results, so stored results are recomputed when the code changes
+RESULTS_CODE_FILES = [
+    "generate_results.py", "hypothesis_tests.py", "null_distributions.py", "group_index.py", "response_cube.py",
+]
+
+_RESULTS_CACHE = {}
+
+# The fingerprints of the dataframes hashed so far, keyed on `id(df)`, with a weak reference to the dataframe so an id
+# reused by a later dataframe is not mistaken for it. The entries are removed when the dataframes are deleted.
+_DATAFRAME_FINGERPRINTS = {}
+
+
+def get_dataframe_fingerprint(df):
+    """
+    Hashes the contents of a dataframe, so that equal data gives the same fingerprint independent of which object
+    holds it.
+
+    The memoized results, the shared response cube and the results store all key on this fingerprint, so it is only
+    found once per dataframe, and then reused as long as the dataframe exists. The dataframe should therefore not be
+    changed after it is first fingerprinted, like the data from `src.utils.get_all_data()`.
+
+    Args:
+        df (pd.DataFrame): The dataframe to hash.
+
+    Returns:
+        str: Hex digest of the columns, dtypes, index and values.
+    """
+    key = id(df)
+    cached = _DATAFRAME_FINGERPRINTS.get(key)
+    if cached is not None and cached[0]() is df:
+        return cached[1]
+
+    fingerprint = _hash_dataframe(df)
+    reference = weakref.ref(df, lambda _: _DATAFRAME_FINGERPRINTS.pop(key, None))
+    _DATAFRAME_FINGERPRINTS[key] = (reference, fingerprint)
+    return fingerprint
+
+
+def _hash_dataframe(df):
+    """
+    Hashes the contents of a dataframe, see `get_dataframe_fingerprint()`.
+    """
+    hasher = hashlib.sha256()
+    hasher.update(repr(list(df.columns)).encode())
+    hasher.update(repr([str(dtype) for dtype in df.dtypes]).encode())
+    try:
+        row_hashes = pd.util.hash_pandas_object(df, index=True)
+    except TypeError:  # Unhashable cells, like lists, are hashed by their string representation
+        row_hashes = pd.util.hash_pandas_object(df.astype(str), index=True)
+    hasher.update(row_hashes.to_numpy().tobytes())
+    return hasher.hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def get_code_fingerprint(filenames):
+    """
+    Hashes the contents of source files in `src/`. The files do not change while running, so the hashes are cached.
+
+    Args:
+        filenames (tuple of str): The filenames, like "generate_results.py".
+
+    Returns:
+        str: Hex digest of the files.
+    """
+    hasher = hashlib.sha256()
+    for filename in filenames:
+        hasher.update(filename.encode())
+        hasher.update((Path(__file__).parent / filename).read_bytes())
+    return hasher.hexdigest()
+
+
+def get_results_fingerprint(df, arguments):
+    """
+    Hashes everything the results of a function depend on: the dataframe, the arguments, the constants in
+    `RESULT_CONSTANTS` and the code in `RESULTS_CODE_FILES`.
+
+    Args:
+        df (pd.DataFrame): The dataframe the results are computed from.
+        arguments (dict): The other arguments to the function computing the results.
+
+    Returns:
+        str: Hex digest of the inputs.
+    """
+    hasher = hashlib.sha256()
+    hasher.update(get_dataframe_fingerprint(df).encode())
+    hasher.update(repr(sorted(arguments.items())).encode())
+    hasher.update(repr([CONSTANTS[name] for name in RESULT_CONSTANTS]).encode())
+    hasher.update(get_code_fingerprint(tuple(RESULTS_CODE_FILES)).encode())
+    return hasher.hexdigest()
+
+
+def clear_results_cache():
+    """
+    Removes all the memoized results.
+    """
+    _RESULTS_CACHE.clear()
+
+
+def cache_results(ignore=()):
+    """
+    Decorator that memoizes functions computing results from the dataframe, so that the tables using the same
+    results only compute them once. The first argument of the function must be the dataframe.
+
+    The results are keyed on the fingerprint of the dataframe, the other arguments (with defaults filled in) and the
+    constants in `RESULT_CONSTANTS`. A copy of the results is returned, so the callers can change them freely.
+
+    Args:
+        ignore (tuple of str): Names of arguments that do not change the results, like the number of workers. These
+            are left out of the key.
+
+    Returns:
+        callable: The decorator.
+    """
+    def decorator(function):
+        signature = inspect.signature(function)
+
+        @functools.wraps(function)
+        def wrapper(df, *args, **kwargs):
+            arguments = signature.bind(df, *args, **kwargs)
+            arguments.apply_defaults()
+            key = (
+                function.__module__,
+                function.__qualname__,
+                get_dataframe_fingerprint(df),
+                tuple(
+                    (name, value) for name, value in list(arguments.arguments.items())[1:] if name not in ignore
+                ),
+                tuple(CONSTANTS[name] for name in RESULT_CONSTANTS),
+            )
+            if key not in _RESULTS_CACHE:
+                _RESULTS_CACHE[key] = function(df, *args, **kwargs)
+            return copy.deepcopy(_RESULTS_CACHE[key])
+
+        return wrapper
+
+    return decorator
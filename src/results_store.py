@@ -0,0 +1,198 @@
+import hashlib
+import os
+import tempfile
+
+import msgpack
+import numpy as np
+
+from src.paths import RESULTS_FOLDER
+from src.results_cache import get_results_fingerprint
+
+# Bump when the layout of the stored files or of the result dicts change, so old files are recomputed
+RESULTS_SCHEMA_VERSION = 2
+
+# msgpack extension types, for the types in the result dicts that msgpack does not keep by itself
+_TUPLE_EXT_TYPE = 1
+_NUMPY_SCALAR_EXT_TYPE = 2
+
+
+def _pack(obj):
+    """
+    Packs an object to msgpack bytes, with the extension types from `_encode()`.
+    """
+    return msgpack.packb(obj, default=_encode, strict_types=True, use_bin_type=True)
+
+
+def _unpack(data):
+    """
+    Unpacks msgpack bytes from `_pack()`.
+    """
+    return msgpack.unpackb(data, ext_hook=_decode, raw=False, strict_map_key=False)
+
+
+def _encode(obj):
+    """
+    Encodes the objects msgpack can not store directly. With `strict_types=True`, tuples and numpy scalars (like
+    `np.float64`, which is a subclass of float) end up here instead of being turned into lists and plain floats.
+    """
+    if isinstance(obj, tuple):
+        return msgpack.ExtType(_TUPLE_EXT_TYPE, _pack(list(obj)))
+    if isinstance(obj, np.generic):
+        return msgpack.ExtType(_NUMPY_SCALAR_EXT_TYPE, _pack([obj.dtype.str, obj.tobytes()]))
+    raise TypeError(f"Can not store object of type {type(obj)} in the results store. ")
+
+
+def _decode(code, data):
+    """
+    Decodes the extension types from `_encode()`.
+    """
+    if code == _TUPLE_EXT_TYPE:
+        return tuple(_unpack(data))
+    if code == _NUMPY_SCALAR_EXT_TYPE:
+        dtype, value = _unpack(data)
+        return np.frombuffer(value, dtype=np.dtype(dtype))[0]
+    return msgpack.ExtType(code, data)
+
+
+def _get_results_path(name):
+    """
+    Returns the path of the stored results with the given name.
+    """
+    return RESULTS_FOLDER / f"{name}.msgpack"
+
+
+def get_upstream_fingerprint(df):
+    """
+    Fingerprints what all the stored results are computed from: the data, the constants changing the results and the
+    code computing them. It is stored with every result, so the same fingerprint can be found without the data, see
+    `get_stored_upstream_fingerprint()`.
+
+    Args:
+        df (pd.DataFrame): The dataframe with the data.
+
+    Returns:
+        str: Hex digest of the inputs.
+    """
+    return get_results_fingerprint(df, {})
+
+
+def get_stored_upstream_fingerprint():
+    """
+    Returns the upstream fingerprint the stored results were computed from, see `get_upstream_fingerprint()`. This is
+    the same fingerprint as from the data, as long as all the stored results are computed from the same data.
+
+    Returns:
+        str: The upstream fingerprint of the stored results. If they are computed from different data, or some can not
+            be read, a hash of all the fingerprints, which does not match any data.
+    """
+    fingerprints = set()
+    for file_path in sorted(RESULTS_FOLDER.glob("*.msgpack")):
+        data = _read_results_file(file_path)
+        fingerprints.add(None if data is None else data.get("upstream_fingerprint"))
+    if len(fingerprints) == 1 and None not in fingerprints:
+        return fingerprints.pop()
+    return hashlib.sha256(repr(sorted(str(fingerprint) for fingerprint in fingerprints)).encode()).hexdigest()
+
+
+def save_results(name, results, fingerprint, upstream_fingerprint=None):
+    """
+    Saves results to the results store.
+
+    Args:
+        name (str): Name of the results, used as the filename.
+        results (dict): The nested results dict.
+        fingerprint (str): Fingerprint of the inputs the results were computed from, see
+            `src.results_cache.get_results_fingerprint()`.
+        upstream_fingerprint (str or None): Fingerprint of the data the results were computed from, see
+            `get_upstream_fingerprint()`.
+    """
+    os.makedirs(RESULTS_FOLDER, exist_ok=True)
+    data = {
+        "schema_version": RESULTS_SCHEMA_VERSION,
+        "fingerprint": fingerprint,
+        "upstream_fingerprint": upstream_fingerprint,
+        "results": results,
+    }
+    # Written to a temporary file first and then moved into place, so an interrupted run does not leave a broken file
+    file_descriptor, temporary_path = tempfile.mkstemp(dir=RESULTS_FOLDER, suffix=".msgpack.tmp")
+    try:
+        with os.fdopen(file_descriptor, "wb") as outfile:
+            outfile.write(_pack(data))
+        os.replace(temporary_path, _get_results_path(name))
+    except BaseException:
+        os.unlink(temporary_path)
+        raise
+
+
+def _read_results_file(file_path):
+    """
+    Reads a file from the results store, with the results and the fingerprints.
+
+    Returns:
+        dict or None: The contents of the file, or None if it does not exist, can not be read or has an old schema
+            version.
+    """
+    if not file_path.exists():
+        return None
+    with open(file_path, "rb") as infile:
+        try:
+            data = _unpack(infile.read())
+        except (ValueError, msgpack.UnpackException):  # A broken file, which is computed again
+            return None
+    if not isinstance(data, dict) or data.get("schema_version") != RESULTS_SCHEMA_VERSION:
+        return None
+    return data
+
+
+def load_results(name, fingerprint=None):
+    """
+    Loads results from the results store.
+
+    Args:
+        name (str): Name of the results, used as the filename.
+        fingerprint (str or None): If not None, only returns the results if they were computed from inputs with this
+            fingerprint.
+
+    Returns:
+        dict or None: The results, or None if they are not stored, can not be read, have an old schema version or do
+            not match the fingerprint.
+    """
+    data = _read_results_file(_get_results_path(name))
+    if data is None:
+        return None
+    if fingerprint is not None and data.get("fingerprint") != fingerprint:
+        return None
+    return data["results"]
+
+
+def load_or_compute_results(name, function, df=None, **kwargs):
+    """
+    Returns results from the results store if they are up to date, and computes and stores them if not.
+
+    Args:
+        name (str): Name of the results, used as the filename.
+        function (callable): Function computing the results, called as `function(df, **kwargs)`.
+        df (pd.DataFrame or None): The dataframe with the data. If None, the stored results are returned without
+            checking that they are up to date, so the tables can be rendered without the data.
+        **kwargs: Other arguments to `function`. Must be the arguments that change the results.
+
+    Raises:
+        FileNotFoundError: If `df` is None and the results are not stored.
+
+    Returns:
+        dict: The results.
+    """
+    if df is None:
+        results = load_results(name)
+        if results is None:
+            raise FileNotFoundError(
+                f"No stored results for {name} in {RESULTS_FOLDER}. Run with the data to compute them first. "
+            )
+        return results
+
+    fingerprint = get_results_fingerprint(df, kwargs)
+    results = load_results(name, fingerprint=fingerprint)
+    if results is None:
+        results = function(df, **kwargs)
+        save_results(name, results, fingerprint=fingerprint, upstream_fingerprint=get_upstream_fingerprint(df))
+    return results
@@ -1,19 +1,138 @@
+import hashlib
+import importlib.util
+import json
+import os
 import warnings
+from pathlib import Path
 
+import numpy as np
 import pandas as pd
 
-from src.get_constants import get_constants
-from src.paths import NETTSKJEMA_PATH, NETTSKJEMA_QUESTIONS_PATH
-from src.process_data import process_nettskjema_data, process_participant_data
+import src.process_data
+from src.get_constants import CONSTANTS_PATH, get_constant_overrides, get_constants
+from src.paths import (CACHE_FOLDER, DATA_SNAPSHOT_FINGERPRINT_PATH, DATA_SNAPSHOT_PATH,
+                       NETTSKJEMA_CACHE_FINGERPRINT_PATH, NETTSKJEMA_CACHE_PATH, NETTSKJEMA_PATH,
+                       NETTSKJEMA_QUESTIONS_PATH, RESPONSE_CUBE_FOLDER, get_experiment_results_path,
+                       get_participant_numbers)
+from src.process_data import (_get_file_fingerprint, process_nettskjema_data, process_participant_data,
+                              process_participant_data_in_chunks)
+from src.response_cube import (RESPONSE_VARIABLES, ResponseCube, set_dataframe_cube, write_axes,
+                               write_dataframe_chunks)
 
 CONSTANTS = get_constants()
+WEBSITES = CONSTANTS["websites"]
+DEVICES = CONSTANTS["devices"]
+
+# calamine reads Excel files much faster than openpyxl, so it is used when it is installed
+EXCEL_ENGINE = "calamine" if importlib.util.find_spec("python_calamine") is not None else "openpyxl"
+
+# The constants the processed data depends on. Overriding other constants, like the number of bootstraps, does not
+# make the data snapshot out of date.
+DATA_CONSTANTS = [
+    "websites", "devices", "nettskjema_column_names", "correct_cookie_answers", "wrong_cookie_answers",
+    "cookie_consent_likert_mapping", "age_mapping",
+]
+
+
+def get_n_workers(n_workers=None, constant_name="n_workers"):
+    """
+    Finds the number of worker processes to use. 0, and None (null in `constants.yaml`) for the constant, mean all
+    cores.
+
+    Args:
+        n_workers (int or None): The number of workers. If None, uses `CONSTANTS[constant_name]`.
+        constant_name (str): The constant with the number of workers, "n_workers" or "n_table_workers".
+
+    Returns:
+        int: The number of worker processes, at least 1.
+    """
+    if n_workers is None:
+        n_workers = CONSTANTS[constant_name]
+    if not n_workers:
+        n_workers = os.cpu_count() or 1
+    return max(int(n_workers), 1)
+
+
+def _read_cached_dataframe(file_path, fingerprint_path, fingerprint):
+    """
+    Reads a cached dataframe, if it was made from sources with the same fingerprint.
+
+    Args:
+        file_path (Path): Path to the pickled dataframe.
+        fingerprint_path (Path): Path to the JSON file with the fingerprint of the sources it was made from.
+        fingerprint (dict): Fingerprint of the current sources.
+
+    Returns:
+        pd.DataFrame or None: The dataframe, or None if there is no up to date cache.
+    """
+    if not file_path.exists() or not fingerprint_path.exists():
+        return None
+    with open(fingerprint_path, "r") as infile:
+        try:
+            cached_fingerprint = json.load(infile)
+        except json.JSONDecodeError:
+            return None
+    if cached_fingerprint != fingerprint:
+        return None
+    return pd.read_pickle(file_path)
+
+
+def _write_cached_dataframe(df, file_path, fingerprint_path, fingerprint):
+    """
+    Writes a dataframe to the cache, with the fingerprint of the sources it was made from.
+
+    Args:
+        df (pd.DataFrame): The dataframe.
+        file_path (Path): Path to write the pickled dataframe to.
+        fingerprint_path (Path): Path to write the fingerprint to, as JSON.
+        fingerprint (dict): Fingerprint of the sources.
+    """
+    if not os.path.exists(CACHE_FOLDER):
+        os.makedirs(CACHE_FOLDER)
+    # The fingerprint is removed first and written last, so a partially written cache is never read
+    fingerprint_path.unlink(missing_ok=True)
+    df.to_pickle(file_path)
+    with open(fingerprint_path, "w") as outfile:
+        json.dump(fingerprint, outfile, indent=2)
+
+
+def read_raw_nettskjema_data(use_cache=True):
+    """
+    Reads the nettskjema Excel file, without processing it.
+
+    Reading the Excel file is slow, so it is converted once to a pickle in the cache folder, which is read instead as
+    long as the Excel file has the same size and modification time.
+
+    Args:
+        use_cache (bool): Whether or not to read and write the cached conversion.
+
+    Returns:
+        pd.DataFrame: The nettskjema data, with the questions as column names.
+    """
+    fingerprint = {
+        "pandas_version": pd.__version__,
+        "engine": EXCEL_ENGINE,
+        "nettskjema_file": _get_file_fingerprint(NETTSKJEMA_PATH),
+    }
+    if use_cache:
+        df = _read_cached_dataframe(NETTSKJEMA_CACHE_PATH, NETTSKJEMA_CACHE_FINGERPRINT_PATH, fingerprint)
+        if df is not None:
+            return df
+
+    with warnings.catch_warnings():  # Ignore warning about non standard formating in excel file
+        warnings.filterwarnings("ignore", message="Workbook contains no default style")
+        df = pd.read_excel(NETTSKJEMA_PATH, engine=EXCEL_ENGINE)
+
+    if use_cache:
+        _write_cached_dataframe(df, NETTSKJEMA_CACHE_PATH, NETTSKJEMA_CACHE_FINGERPRINT_PATH, fingerprint)
+    return df
 
 
 def write_nettskjema_questions_to_file():
     """
     Writes the original questions to file, which are the original columns names in the nettskjema file.
     """
-    df = pd.read_excel(NETTSKJEMA_PATH)
+    df = read_raw_nettskjema_data()
     with open(NETTSKJEMA_QUESTIONS_PATH, "w") as outfile:
         for i, question in enumerate(df.columns):
             outfile.write(f"{i}: {question} \n")
@@ -26,9 +145,7 @@ def read_nettskjema_data():
     Returns:
         pd.DataFrame: The dataframe with the data.
     """
-    with warnings.catch_warnings():  # Ignore warning about non standard formating in excel file
-        warnings.filterwarnings("ignore", message="Workbook contains no default style")
-        df = pd.read_excel(NETTSKJEMA_PATH)
+    df = read_raw_nettskjema_data()
     df = process_nettskjema_data(df)
 
     return df
@@ -44,14 +161,186 @@ def read_participant_data():
     return process_participant_data()
 
 
-def get_all_data():
+def _get_data_fingerprint():
+    """
+    Fingerprints everything the processed data depends on: the nettskjema file, the participant files, the constants
+    and the code processing the data. Files are fingerprinted by size and modification time, and the constants and
+    code by their contents, since they are small.
+
+    Returns:
+        dict: JSON serializable fingerprint.
+    """
+    source_files = [NETTSKJEMA_PATH] + [
+        get_experiment_results_path(participant_number) for participant_number in get_participant_numbers()
+    ]
+    code_files = [CONSTANTS_PATH, Path(__file__), Path(src.process_data.__file__)]
+
+    fingerprint = {
+        "pandas_version": pd.__version__,
+        "excel_engine": EXCEL_ENGINE,
+        "constant_overrides": {
+            name: value for name, value in get_constant_overrides().items() if name in DATA_CONSTANTS
+        },
+        "source_files": {str(file_path): _get_file_fingerprint(file_path) for file_path in source_files},
+        "code_files": {
+            file_path.name: hashlib.sha256(file_path.read_bytes()).hexdigest() for file_path in code_files
+        },
+    }
+    return fingerprint
+
+
+def get_all_data(use_snapshot=True):
     """
     Reads and merges the nettskjema data and the participant data.
 
+    The processed data is saved as a snapshot in the cache folder. As long as none of the source files, the constants
+    or the processing code have changed, the snapshot is read instead of processing the data again.
+
+    With the snapshot, the responses are also saved as a memory-mapped cube (see `get_response_cube()`), which is used
+    for the statistics and tests on the returned dataframe, see `src.response_cube.get_dataframe_cube()`.
+
+    Args:
+        use_snapshot (bool): Whether or not to read and write the snapshot and the response cube.
+
     Returns:
         pd: Dataframe with the nettskjema data and the experiment data.
     """
-    nettskjema_df = read_nettskjema_data()
-    participant_df = read_participant_data()
-    df = pd.merge(nettskjema_df, participant_df, left_on="submission_id", right_on="nettskjema_id")
+    df = None
+    if use_snapshot:
+        fingerprint = _get_data_fingerprint()
+        df = _read_cached_dataframe(DATA_SNAPSHOT_PATH, DATA_SNAPSHOT_FINGERPRINT_PATH, fingerprint)
+
+    if df is None:
+        nettskjema_df = read_nettskjema_data()
+        participant_df = read_participant_data()
+        df = pd.merge(nettskjema_df, participant_df, left_on="submission_id", right_on="nettskjema_id")
+        if use_snapshot:
+            _write_cached_dataframe(df, DATA_SNAPSHOT_PATH, DATA_SNAPSHOT_FINGERPRINT_PATH, fingerprint)
+
+    if use_snapshot:
+        set_dataframe_cube(df, _get_response_cube(fingerprint, df=df))
     return df
+
+
+def _get_cube_file_paths(suffix=""):
+    """
+    Returns the `.npy` files of the response cube in the cache folder, for each variable.
+    """
+    return {variable: RESPONSE_CUBE_FOLDER / f"{variable}{suffix}.npy" for variable in RESPONSE_VARIABLES}
+
+
+def _write_response_cube_from_dataframe(df):
+    """
+    Writes the responses in the data from `get_all_data()` as a response cube in the cache folder, one chunk of
+    `CONSTANTS["response_cube_chunk_size"]` rows at a time, so the whole cube is never in memory next to the
+    dataframe.
+
+    Args:
+        df (pd.DataFrame): The data from `get_all_data()`.
+    """
+    chunk_size = CONSTANTS["response_cube_chunk_size"]
+    chunks = (df.iloc[start:start + chunk_size] for start in range(0, len(df), chunk_size))
+    write_dataframe_chunks(_get_cube_file_paths(), chunks, len(df))
+    write_axes(RESPONSE_CUBE_FOLDER, df.index)
+
+
+def _get_submission_ids():
+    """
+    Returns the submission ids of the nettskjema answers, in the order of the rows from `read_nettskjema_data()`,
+    without processing the nettskjema data.
+
+    Returns:
+        pd.Series: The submission ids.
+    """
+    column_names = list(CONSTANTS["nettskjema_column_names"].values())
+    return read_raw_nettskjema_data().iloc[:, column_names.index("submission_id")].rename("submission_id")
+
+
+def _write_response_cube():
+    """
+    Writes the responses in the data from `get_all_data()` as a response cube in the cache folder, without having
+    the wide dataframe or the cube in memory.
+
+    The participants are processed one chunk of `CONSTANTS["response_cube_chunk_size"]` participants at a time (see
+    `src.process_data.process_participant_data_in_chunks()`), and their values are written into memory-mapped `.npy`
+    files. Afterwards the participants are put in the same order as in `get_all_data()`, from the merge on the ids
+    only, one device and website at a time.
+    """
+    n_participant_files = len(get_participant_numbers())
+    nettskjema_ids = []
+
+    def get_chunks():
+        for chunk_df in process_participant_data_in_chunks(CONSTANTS["response_cube_chunk_size"]):
+            nettskjema_ids.extend(chunk_df["nettskjema_id"])
+            yield chunk_df
+
+    # The participants in the order of the participant files
+    unordered_paths = _get_cube_file_paths(suffix=".unordered")
+    write_dataframe_chunks(unordered_paths, get_chunks(), n_participant_files)
+
+    # The positions of the participants in `get_all_data()`
+    positions = pd.merge(
+        _get_submission_ids().to_frame(),
+        pd.DataFrame({"nettskjema_id": nettskjema_ids, "position": np.arange(len(nettskjema_ids))}),
+        left_on="submission_id", right_on="nettskjema_id",
+    )["position"].to_numpy()
+    is_in_order = np.array_equal(positions, np.arange(n_participant_files))
+
+    for variable, file_path in _get_cube_file_paths().items():
+        unordered_path = unordered_paths[variable]
+        if is_in_order:
+            os.replace(unordered_path, file_path)
+            continue
+        unordered_values = np.load(unordered_path, mmap_mode="r")
+        shape = (len(DEVICES), len(WEBSITES), len(positions))
+        values = np.lib.format.open_memmap(file_path, mode="w+", dtype=np.float64, shape=shape)
+        for i in range(len(DEVICES)):
+            for j in range(len(WEBSITES)):
+                values[i, j] = unordered_values[i, j, positions]
+        values.flush()
+        del values, unordered_values
+        unordered_path.unlink()
+    write_axes(RESPONSE_CUBE_FOLDER, pd.RangeIndex(len(positions)))
+
+
+def _get_response_cube(fingerprint, df=None, mmap_mode="r"):
+    """
+    Returns the response cube saved in the cache folder, and writes it first if it was not made from sources with
+    the fingerprint `fingerprint`, from `_get_data_fingerprint()`. It is written from `df` if it is given, and else
+    from the participant files, one chunk at a time.
+    """
+    fingerprint_path = RESPONSE_CUBE_FOLDER / "fingerprint.json"
+    if fingerprint_path.exists():
+        with open(fingerprint_path, "r") as infile:
+            try:
+                cube_fingerprint = json.load(infile)
+            except json.JSONDecodeError:
+                cube_fingerprint = None
+        if cube_fingerprint == fingerprint:
+            return ResponseCube.load(RESPONSE_CUBE_FOLDER, mmap_mode=mmap_mode)
+
+    # The fingerprint is removed first and written last, so a partially written cube is never read
+    os.makedirs(RESPONSE_CUBE_FOLDER, exist_ok=True)
+    fingerprint_path.unlink(missing_ok=True)
+    if df is not None:
+        _write_response_cube_from_dataframe(df)
+    else:
+        _write_response_cube()
+    with open(fingerprint_path, "w") as outfile:
+        json.dump(fingerprint, outfile, indent=2)
+    return ResponseCube.load(RESPONSE_CUBE_FOLDER, mmap_mode=mmap_mode)
+
+
+def get_response_cube(mmap_mode="r"):
+    """
+    Returns the responses from the observational study as a `ResponseCube`, memory-mapped from `.npy` files in the
+    cache folder. The files are written one chunk of participants at a time the first time, and again when the
+    sources change, see `_write_response_cube()`.
+
+    Args:
+        mmap_mode (str or None): Memory-map mode, see `ResponseCube.load()`. None loads the cube into memory.
+
+    Returns:
+        ResponseCube: The responses.
+    """
+    return _get_response_cube(_get_data_fingerprint(), mmap_mode=mmap_mode)
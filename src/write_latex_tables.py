@@ -1,10 +1,10 @@
 import os
-from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
 
-from src.generate_results import (get_all_friedman_test_results, get_all_group_test_results, get_website_statistics,
+from src.generate_results import (get_all_friedman_test_results, get_all_group_test_results,
+                                  get_all_wilcoxon_test_results, get_website_statistics,
                                   get_withdrawal_and_answer_times)
-from src.get_constants import get_constants
-from src.hypothesis_tests import run_pairwise_wilcoxon_tests
+from src.get_constants import PROJECT_ROOT, get_constant_overrides, get_constants, override_constants
 from src.latex_table_captions import (BOOTSTRAP_EXTRA_ACCEPTS_CAPTION, BOOTSTRAP_EXTRA_TIME_CAPTION,
                                       BOOTSTRAP_MAIN_CAPTION, FRIEDMAN_CAPTION, MEAN_AND_SD_EXTRA_ACCEPTS_CAPTION,
                                       MEAN_AND_SD_EXTRA_TIME_CAPTION, MEAN_AND_SD_MAIN_CAPTION,
@@ -20,12 +20,17 @@ from src.make_latex_tables import (make_bootstrap_latex_table, make_devices_wilc
                                    make_mean_sd_latex_table, make_nettskjema_report_latex, make_shapiro_latex_table,
                                    make_website_statistics_latex_table, make_wilcoxon_latex_table,
                                    make_withdrawal_statistics_latex_table)
+from src.results_store import load_or_compute_results
+from src.utils import get_n_workers
 
 CONSTANTS = get_constants()
 GROUP_TESTS_FOLDER = CONSTANTS["paths"]["folders"]["group_tests_folder"]
 WEBISTE_TESTS_FOLDER = CONSTANTS["paths"]["folders"]["website_tests_folder"]
 OVERVIEW_TABLES_FOLDER = CONSTANTS["paths"]["folders"]["overview_tables_folder"]
 
+# The dataframe in the worker processes writing tables, set once per worker by `_init_table_worker()`
+_WORKER_DF = None
+
 
 def _write_latex_table_to_file(text, filename, folder):
     """
@@ -35,14 +40,17 @@ def _write_latex_table_to_file(text, filename, folder):
         text (str): The string of the LaTeX table.
         filename (str): The filename.
         folder (str): The subfolder to store the latex table in.
+
+    Returns:
+        Path: The path to the written table.
     """
     # We have most paths handled in `src.paths.py`, but it is simpler to handle these here.
-    folder_path = Path(CONSTANTS["paths"]["folders"]["latex_tables_folder"]) / folder
-    if not os.path.exists(folder_path):
-        os.makedirs(folder_path)
+    folder_path = PROJECT_ROOT / CONSTANTS["paths"]["folders"]["latex_tables_folder"] / folder
+    os.makedirs(folder_path, exist_ok=True)
     file_path = folder_path / filename
     with open(file_path, "w") as outfile:
         outfile.write(text)
+    return file_path
 
 
 def write_nettskjema_report(df):
@@ -53,13 +61,18 @@ def write_nettskjema_report(df):
 
     Args:
         df (pd.DataFrame): The dataframe with the results. Get with `src.utils.get_all_data()`
+
+    Returns:
+        Path: The path to the written table.
     """
+    if df is None:
+        raise ValueError("The nettskjema report is made from the data, and can not be read from the results store. ")
     caption = NETTSKJEMA_REPORT_CAPTION.replace("\n", " ")
     label = "tab:nettskjema_report"
     filename = "nettskjema_report.txt"
     folder = OVERVIEW_TABLES_FOLDER
     nettskjema_table = make_nettskjema_report_latex(df, caption=caption, label=label)
-    _write_latex_table_to_file(text=nettskjema_table, filename=filename, folder=folder)
+    return _write_latex_table_to_file(text=nettskjema_table, filename=filename, folder=folder)
 
 
 def write_shapiro_wilk_main(df):
@@ -68,13 +81,17 @@ def write_shapiro_wilk_main(df):
     accepts and total average time spent.
 
     Args:
-        df (pd.DataFrame): The dataframe with the results. Get with `src.utils.get_all_data()`
+        df (pd.DataFrame or None): The dataframe with the results. Get with `src.utils.get_all_data()`. If None,
+            renders the results from the results store, see `src.results_store.load_or_compute_results()`.
+
+    Returns:
+        Path: The path to the written table.
     """
     caption = SHAPIRO_WILK_MAIN_CAPTION.replace("\n", " ")
     label = "tab:shapiro_wilk_main"
     filename = "shapiro_wilk_main.txt"
     folder = GROUP_TESTS_FOLDER
-    results = get_all_group_test_results(df, test_type="shapiro-wilk")
+    results = load_or_compute_results("shapiro_wilk", get_all_group_test_results, df, test_type="shapiro-wilk")
     shapiro_wilk_table = make_shapiro_latex_table(
         results,
         test_variables=[
@@ -85,7 +102,7 @@ def write_shapiro_wilk_main(df):
         caption=caption,
         label=label,
     )
-    _write_latex_table_to_file(text=shapiro_wilk_table, filename=filename, folder=folder)
+    return _write_latex_table_to_file(text=shapiro_wilk_table, filename=filename, folder=folder)
 
 
 def write_shapiro_wilk_extra_accepts(df):
@@ -94,13 +111,17 @@ def write_shapiro_wilk_extra_accepts(df):
     computer on phone.
 
     Args:
-        df (pd.DataFrame): The dataframe with the results. Get with `src.utils.get_all_data()`
+        df (pd.DataFrame or None): The dataframe with the results. Get with `src.utils.get_all_data()`. If None,
+            renders the results from the results store, see `src.results_store.load_or_compute_results()`.
+
+    Returns:
+        Path: The path to the written table.
     """
     caption = SHAPIRO_WILK_EXTRA_ACCEPTS_CAPTION.replace("\n", " ")
     label = "tab:shapiro_wilk_extra_accepts"
     filename = "shapiro_wilk_extra_accepts.txt"
     folder = GROUP_TESTS_FOLDER
-    results = get_all_group_test_results(df, test_type="shapiro-wilk")
+    results = load_or_compute_results("shapiro_wilk", get_all_group_test_results, df, test_type="shapiro-wilk")
     shapiro_wilk_table = make_shapiro_latex_table(
         results,
         test_variables=[
@@ -110,7 +131,7 @@ def write_shapiro_wilk_extra_accepts(df):
         caption=caption,
         label=label,
     )
-    _write_latex_table_to_file(text=shapiro_wilk_table, filename=filename, folder=folder)
+    return _write_latex_table_to_file(text=shapiro_wilk_table, filename=filename, folder=folder)
 
 
 def write_shapiro_wilk_extra_time(df):
@@ -119,13 +140,17 @@ def write_shapiro_wilk_extra_time(df):
     computer and phone.
 
     Args:
-        df (pd.DataFrame): The dataframe with the results. Get with `src.utils.get_all_data()`
+        df (pd.DataFrame or None): The dataframe with the results. Get with `src.utils.get_all_data()`. If None,
+            renders the results from the results store, see `src.results_store.load_or_compute_results()`.
+
+    Returns:
+        Path: The path to the written table.
     """
     caption = SHAPIRO_WILK_EXTRA_TIME_CAPTION.replace("\n", " ")
     label = "tab:shapiro_wilk_extra_time"
     filename = "shapiro_wilk_extra_time.txt"
     folder = GROUP_TESTS_FOLDER
-    results = get_all_group_test_results(df, test_type="shapiro-wilk")
+    results = load_or_compute_results("shapiro_wilk", get_all_group_test_results, df, test_type="shapiro-wilk")
     shaprio_wilk_table = make_shapiro_latex_table(
         results,
         test_variables=[
@@ -135,7 +160,7 @@ def write_shapiro_wilk_extra_time(df):
         caption=caption,
         label=label,
     )
-    _write_latex_table_to_file(text=shaprio_wilk_table, filename=filename, folder=folder)
+    return _write_latex_table_to_file(text=shaprio_wilk_table, filename=filename, folder=folder)
 
 
 def write_mean_sd_main(df):
@@ -144,13 +169,17 @@ def write_mean_sd_main(df):
     total average time spent on cookie banners.
 
     Args:
-        df (pd.DataFrame): The dataframe with the results. Get with `src.utils.get_all_data()`
+        df (pd.DataFrame or None): The dataframe with the results. Get with `src.utils.get_all_data()`. If None,
+            renders the results from the results store, see `src.results_store.load_or_compute_results()`.
+
+    Returns:
+        Path: The path to the written table.
     """
     caption = MEAN_AND_SD_MAIN_CAPTION.replace("\n", " ")
     label = "tab:mean_and_sd_main"
     filename = "mean_and_sd_main.txt"
     folder = GROUP_TESTS_FOLDER
-    results = get_all_group_test_results(df, test_type="mean-sd")
+    results = load_or_compute_results("mean_sd", get_all_group_test_results, df, test_type="mean-sd")
     mean_and_sd_table = make_mean_sd_latex_table(
         results_dict=results,
         test_variables=[
@@ -161,7 +190,7 @@ def write_mean_sd_main(df):
         caption=caption,
         label=label,
     )
-    _write_latex_table_to_file(text=mean_and_sd_table, filename=filename, folder=folder)
+    return _write_latex_table_to_file(text=mean_and_sd_table, filename=filename, folder=folder)
 
 
 def write_mean_sd_extra_accepts(df):
@@ -170,13 +199,17 @@ def write_mean_sd_extra_accepts(df):
     accepts.
 
     Args:
-        df (pd.DataFrame): The dataframe with the results. Get with `src.utils.get_all_data()`
+        df (pd.DataFrame or None): The dataframe with the results. Get with `src.utils.get_all_data()`. If None,
+            renders the results from the results store, see `src.results_store.load_or_compute_results()`.
+
+    Returns:
+        Path: The path to the written table.
     """
     caption = MEAN_AND_SD_EXTRA_ACCEPTS_CAPTION.replace("\n", " ")
     label = "tab:mean_and_sd_extra_accepts"
     filename = "mean_and_sd_extra_accepts.txt"
     folder = GROUP_TESTS_FOLDER
-    results = get_all_group_test_results(df, test_type="mean-sd")
+    results = load_or_compute_results("mean_sd", get_all_group_test_results, df, test_type="mean-sd")
     mean_and_sd_table = make_mean_sd_latex_table(
         results_dict=results,
         test_variables=[
@@ -186,7 +219,7 @@ def write_mean_sd_extra_accepts(df):
         caption=caption,
         label=label,
     )
-    _write_latex_table_to_file(text=mean_and_sd_table, filename=filename, folder=folder)
+    return _write_latex_table_to_file(text=mean_and_sd_table, filename=filename, folder=folder)
 
 
 def write_mean_sd_extra_time(df):
@@ -194,13 +227,17 @@ def write_mean_sd_extra_time(df):
     Writes table with means and standard deviations for all subgroups for computer and phone for the answer time.
 
     Args:
-        df (pd.DataFrame): The dataframe with the results. Get with `src.utils.get_all_data()`
+        df (pd.DataFrame or None): The dataframe with the results. Get with `src.utils.get_all_data()`. If None,
+            renders the results from the results store, see `src.results_store.load_or_compute_results()`.
+
+    Returns:
+        Path: The path to the written table.
     """
     caption = MEAN_AND_SD_EXTRA_TIME_CAPTION.replace("\n", " ")
     label = "tab:mean_and_sd_extra_time"
     filename = "mean_and_sd_extra_time.txt"
     folder = GROUP_TESTS_FOLDER
-    results = get_all_group_test_results(df, test_type="mean-sd")
+    results = load_or_compute_results("mean_sd", get_all_group_test_results, df, test_type="mean-sd")
     mean_and_sd_table = make_mean_sd_latex_table(
         results_dict=results,
         test_variables=[
@@ -210,7 +247,7 @@ def write_mean_sd_extra_time(df):
         caption=caption,
         label=label,
     )
-    _write_latex_table_to_file(text=mean_and_sd_table, filename=filename, folder=folder)
+    return _write_latex_table_to_file(text=mean_and_sd_table, filename=filename, folder=folder)
 
 
 def write_bootstrap_main(df):
@@ -218,13 +255,17 @@ def write_bootstrap_main(df):
     Writes table with bootstrap confidence intervals metrics.
 
     Args:
-        df (pd.DataFrame): The dataframe with the results. Get with `src.utils.get_all_data()`
+        df (pd.DataFrame or None): The dataframe with the results. Get with `src.utils.get_all_data()`. If None,
+            renders the results from the results store, see `src.results_store.load_or_compute_results()`.
+
+    Returns:
+        Path: The path to the written table.
     """
     caption = BOOTSTRAP_MAIN_CAPTION.replace("\n", " ")
     label = "tab:bootstrap_main"
     filename = "bootstrap_main.txt"
     folder = GROUP_TESTS_FOLDER
-    results = get_all_group_test_results(df, test_type="bootstrap")
+    results = load_or_compute_results("bootstrap", get_all_group_test_results, df, test_type="bootstrap")
     mean_and_sd_table = make_bootstrap_latex_table(
         results_dict=results,
         test_variables=[
@@ -235,7 +276,7 @@ def write_bootstrap_main(df):
         caption=caption,
         label=label,
     )
-    _write_latex_table_to_file(text=mean_and_sd_table, filename=filename, folder=folder)
+    return _write_latex_table_to_file(text=mean_and_sd_table, filename=filename, folder=folder)
 
 
 def write_bootstrap_extra_accepts(df):
@@ -243,13 +284,17 @@ def write_bootstrap_extra_accepts(df):
     Writes table with bootstrap confidence intervals metrics for number of accepts on computer and phone.
 
     Args:
-        df (pd.DataFrame): The dataframe with the results. Get with `src.utils.get_all_data()`
+        df (pd.DataFrame or None): The dataframe with the results. Get with `src.utils.get_all_data()`. If None,
+            renders the results from the results store, see `src.results_store.load_or_compute_results()`.
+
+    Returns:
+        Path: The path to the written table.
     """
     caption = BOOTSTRAP_EXTRA_ACCEPTS_CAPTION.replace("\n", " ")
     label = "tab:bootstrap_extra_accepts"
     filename = "bootstrap_extra_accepts.txt"
     folder = GROUP_TESTS_FOLDER
-    results = get_all_group_test_results(df, test_type="bootstrap")
+    results = load_or_compute_results("bootstrap", get_all_group_test_results, df, test_type="bootstrap")
     mean_and_sd_table = make_bootstrap_latex_table(
         results_dict=results,
         test_variables=[
@@ -259,7 +304,7 @@ def write_bootstrap_extra_accepts(df):
         caption=caption,
         label=label,
     )
-    _write_latex_table_to_file(text=mean_and_sd_table, filename=filename, folder=folder)
+    return _write_latex_table_to_file(text=mean_and_sd_table, filename=filename, folder=folder)
 
 
 def write_bootstrap_extra_time(df):
@@ -267,13 +312,17 @@ def write_bootstrap_extra_time(df):
     Writes table with bootstrap confidence intervals metrics for time spent on cookie banner for computer and phone.
 
     Args:
-        df (pd.DataFrame): The dataframe with the results. Get with `src.utils.get_all_data()`
+        df (pd.DataFrame or None): The dataframe with the results. Get with `src.utils.get_all_data()`. If None,
+            renders the results from the results store, see `src.results_store.load_or_compute_results()`.
+
+    Returns:
+        Path: The path to the written table.
     """
     caption = BOOTSTRAP_EXTRA_TIME_CAPTION.replace("\n", " ")
     label = "tab:bootstrap_extra_time"
     filename = "bootstrap_extra_time.txt"
     folder = GROUP_TESTS_FOLDER
-    results = get_all_group_test_results(df, test_type="bootstrap")
+    results = load_or_compute_results("bootstrap", get_all_group_test_results, df, test_type="bootstrap")
     mean_and_sd_table = make_bootstrap_latex_table(
         results_dict=results,
         test_variables=[
@@ -283,7 +332,7 @@ def write_bootstrap_extra_time(df):
         caption=caption,
         label=label,
     )
-    _write_latex_table_to_file(text=mean_and_sd_table, filename=filename, folder=folder)
+    return _write_latex_table_to_file(text=mean_and_sd_table, filename=filename, folder=folder)
 
 
 def write_website_statistics_accepts(df):
@@ -291,20 +340,24 @@ def write_website_statistics_accepts(df):
     Writes table with accepts for each website and every device.
 
     Args:
-        df (pd.DataFrame): The dataframe with the results. Get with `src.utils.get_all_data()`
+        df (pd.DataFrame or None): The dataframe with the results. Get with `src.utils.get_all_data()`. If None,
+            renders the results from the results store, see `src.results_store.load_or_compute_results()`.
+
+    Returns:
+        Path: The path to the written table.
     """
     caption = WEBSITE_STATISTICS_ACCEPTS_CAPTION.replace("\n", " ")
     label = "tab:website_statistics_accepts"
     filename = "website_statistics_accepts.txt"
     folder = WEBISTE_TESTS_FOLDER
-    results = get_website_statistics(df)
+    results = load_or_compute_results("website_statistics", get_website_statistics, df)
     website_statistics_table = make_website_statistics_latex_table(
         results,
         test_variable="accepts",
         caption=caption,
         label=label
     )
-    _write_latex_table_to_file(website_statistics_table, filename=filename, folder=folder)
+    return _write_latex_table_to_file(website_statistics_table, filename=filename, folder=folder)
 
 
 def write_website_statistics_time(df):
@@ -312,20 +365,24 @@ def write_website_statistics_time(df):
     Writes the time spent on the different website for all devices, including standard deviations.
 
     Args:
-        df (pd.DataFrame): The dataframe with the results. Get with `src.utils.get_all_data()`
+        df (pd.DataFrame or None): The dataframe with the results. Get with `src.utils.get_all_data()`. If None,
+            renders the results from the results store, see `src.results_store.load_or_compute_results()`.
+
+    Returns:
+        Path: The path to the written table.
     """
     caption = WEBSITE_STATISTICS_TIME_CAPTION.replace("\n", " ")
     label = "tab:website_statistics_time"
     filename = "website_statistics_time.txt"
     folder = WEBISTE_TESTS_FOLDER
-    results = get_website_statistics(df)
+    results = load_or_compute_results("website_statistics", get_website_statistics, df)
     website_statistics_table = make_website_statistics_latex_table(
         results,
         test_variable="time",
         caption=caption,
         label=label
     )
-    _write_latex_table_to_file(website_statistics_table, filename=filename, folder=folder)
+    return _write_latex_table_to_file(website_statistics_table, filename=filename, folder=folder)
 
 
 def write_website_tests_accepts(df):
@@ -333,20 +390,26 @@ def write_website_tests_accepts(df):
     Writes the Wilcoxon tests on the website accepts.
 
     Args:
-        df (pd.DataFrame): The dataframe with the results. Get with `src.utils.get_all_data()`
+        df (pd.DataFrame or None): The dataframe with the results. Get with `src.utils.get_all_data()`. If None,
+            renders the results from the results store, see `src.results_store.load_or_compute_results()`.
+
+    Returns:
+        Path: The path to the written table.
     """
     caption = WEBSITE_DEVICES_TESTS_ACCEPTS_CAPTION.replace("\n", " ")
     label = "tab:website_devices_tests_accepts"
     filename = "website_devices_tests_accepts.txt"
     folder = WEBISTE_TESTS_FOLDER
-    results = get_website_statistics(df, perform_wilcoxon_test=True)
+    results = load_or_compute_results(
+        "website_devices_tests", get_website_statistics, df, perform_wilcoxon_test=True
+    )
     website_statistics_table = make_devices_wilcoxon_table(
         results,
         test_variable="accepts",
         caption=caption,
         label=label
     )
-    _write_latex_table_to_file(website_statistics_table, filename=filename, folder=folder)
+    return _write_latex_table_to_file(website_statistics_table, filename=filename, folder=folder)
 
 
 def write_website_tests_time(df):
@@ -354,20 +417,26 @@ def write_website_tests_time(df):
     Writes the Wilcoxon tests on the website times.
 
     Args:
-        df (pd.DataFrame): The dataframe with the results. Get with `src.utils.get_all_data()`
+        df (pd.DataFrame or None): The dataframe with the results. Get with `src.utils.get_all_data()`. If None,
+            renders the results from the results store, see `src.results_store.load_or_compute_results()`.
+
+    Returns:
+        Path: The path to the written table.
     """
     caption = WEBSITE_DEVICES_TESTS_TIME_CAPTION.replace("\n", " ")
     label = "tab:website_devices_tests_time"
     filename = "website_devices_tests_time.txt"
     folder = WEBISTE_TESTS_FOLDER
-    results = get_website_statistics(df, perform_wilcoxon_test=True)
+    results = load_or_compute_results(
+        "website_devices_tests", get_website_statistics, df, perform_wilcoxon_test=True
+    )
     website_statistics_table = make_devices_wilcoxon_table(
         results,
         test_variable="time",
         caption=caption,
         label=label
     )
-    _write_latex_table_to_file(website_statistics_table, filename=filename, folder=folder)
+    return _write_latex_table_to_file(website_statistics_table, filename=filename, folder=folder)
 
 
 def write_friedman(df):
@@ -376,19 +445,23 @@ def write_friedman(df):
     looking at the number of accepts given.
 
     Args:
-        df (pd.DataFrame): The dataframe with the results. Get with `src.utils.get_all_data()`
+        df (pd.DataFrame or None): The dataframe with the results. Get with `src.utils.get_all_data()`. If None,
+            renders the results from the results store, see `src.results_store.load_or_compute_results()`.
+
+    Returns:
+        Path: The path to the written table.
     """
     caption = FRIEDMAN_CAPTION.replace("\n", " ")
     label = "tab:friedman"
     filename = "friedman.txt"
     folder = WEBISTE_TESTS_FOLDER
-    results = get_all_friedman_test_results(df)
+    results = load_or_compute_results("friedman", get_all_friedman_test_results, df)
     friedman_table = make_friedman_latex_table(
         results_dict=results,
         caption=caption,
         label=label,
     )
-    _write_latex_table_to_file(text=friedman_table, filename=filename, folder=folder)
+    return _write_latex_table_to_file(text=friedman_table, filename=filename, folder=folder)
 
 
 def write_wilcoxon_total_accepts(df):
@@ -396,23 +469,23 @@ def write_wilcoxon_total_accepts(df):
     Writes a Wilcoxon table for each pair of website looking at number of accepts on both devices.
 
     Args:
-        df (pd.DataFrame): The dataframe with the results. Get with `src.utils.get_all_data()`
+        df (pd.DataFrame or None): The dataframe with the results. Get with `src.utils.get_all_data()`. If None,
+            renders the results from the results store, see `src.results_store.load_or_compute_results()`.
+
+    Returns:
+        Path: The path to the written table.
     """
     caption = WILCOXON_TOTAL_ACCEPTS_CAPTION.replace("\n", " ")
     label = "tab:wilcoxon_total_accepts"
     filename = "wilcoxon_total_accepts.txt"
     folder = WEBISTE_TESTS_FOLDER
-    results = run_pairwise_wilcoxon_tests(
-        df,
-        test_variable="accepts",
-        device="both"
-    )
+    results = load_or_compute_results("wilcoxon", get_all_wilcoxon_test_results, df)["accepts"]["both"]
     wilcoxon_table = make_wilcoxon_latex_table(
         results,
         caption=caption,
         label=label,
     )
-    _write_latex_table_to_file(text=wilcoxon_table, filename=filename, folder=folder)
+    return _write_latex_table_to_file(text=wilcoxon_table, filename=filename, folder=folder)
 
 
 def write_wilcoxon_computer_accepts(df):
@@ -420,23 +493,23 @@ def write_wilcoxon_computer_accepts(df):
     Writes a Wilcoxon table for each pair of website looking at number of accepts on computer.
 
     Args:
-        df (pd.DataFrame): The dataframe with the results. Get with `src.utils.get_all_data()`
+        df (pd.DataFrame or None): The dataframe with the results. Get with `src.utils.get_all_data()`. If None,
+            renders the results from the results store, see `src.results_store.load_or_compute_results()`.
+
+    Returns:
+        Path: The path to the written table.
     """
     caption = WILCOXON_COMPUTER_ACCEPTS_CAPTION.replace("\n", " ")
     label = "tab:wilcoxon_computer_accepts"
     filename = "wilcoxon_computer_accepts.txt"
     folder = WEBISTE_TESTS_FOLDER
-    results = run_pairwise_wilcoxon_tests(
-        df,
-        test_variable="accepts",
-        device="computer"
-    )
+    results = load_or_compute_results("wilcoxon", get_all_wilcoxon_test_results, df)["accepts"]["computer"]
     wilcoxon_table = make_wilcoxon_latex_table(
         results,
         caption=caption,
         label=label,
     )
-    _write_latex_table_to_file(text=wilcoxon_table, filename=filename, folder=folder)
+    return _write_latex_table_to_file(text=wilcoxon_table, filename=filename, folder=folder)
 
 
 def write_wilcoxon_phone_accepts(df):
@@ -444,23 +517,23 @@ def write_wilcoxon_phone_accepts(df):
     Writes a Wilcoxon table for each pair of website looking at number of accepts on phone.
 
     Args:
-        df (pd.DataFrame): The dataframe with the results. Get with `src.utils.get_all_data()`
+        df (pd.DataFrame or None): The dataframe with the results. Get with `src.utils.get_all_data()`. If None,
+            renders the results from the results store, see `src.results_store.load_or_compute_results()`.
+
+    Returns:
+        Path: The path to the written table.
     """
     caption = WILCOXON_PHONE_ACCEPTS_CAPTION.replace("\n", " ")
     label = "tab:wilcoxon_phone_accepts"
     filename = "wilcoxon_phone_accepts.txt"
     folder = WEBISTE_TESTS_FOLDER
-    results = run_pairwise_wilcoxon_tests(
-        df,
-        test_variable="accepts",
-        device="phone"
-    )
+    results = load_or_compute_results("wilcoxon", get_all_wilcoxon_test_results, df)["accepts"]["phone"]
     wilcoxon_table = make_wilcoxon_latex_table(
         results,
         caption=caption,
         label=label,
     )
-    _write_latex_table_to_file(text=wilcoxon_table, filename=filename, folder=folder)
+    return _write_latex_table_to_file(text=wilcoxon_table, filename=filename, folder=folder)
 
 
 def write_wilcoxon_total_time(df):
@@ -468,23 +541,23 @@ def write_wilcoxon_total_time(df):
     Writes a Wilcoxon table for each pair of website looking at the time spent on both devices.
 
     Args:
-        df (pd.DataFrame): The dataframe with the results. Get with `src.utils.get_all_data()`
+        df (pd.DataFrame or None): The dataframe with the results. Get with `src.utils.get_all_data()`. If None,
+            renders the results from the results store, see `src.results_store.load_or_compute_results()`.
+
+    Returns:
+        Path: The path to the written table.
     """
     caption = WILCOXON_TOTAL_TIME_CAPTION.replace("\n", " ")
     label = "tab:wilcoxon_total_times"
     filename = "wilcoxon_total_time.txt"
     folder = WEBISTE_TESTS_FOLDER
-    results = run_pairwise_wilcoxon_tests(
-        df,
-        test_variable="time",
-        device="both"
-    )
+    results = load_or_compute_results("wilcoxon", get_all_wilcoxon_test_results, df)["time"]["both"]
     wilcoxon_table = make_wilcoxon_latex_table(
         results,
         caption=caption,
         label=label,
     )
-    _write_latex_table_to_file(text=wilcoxon_table, filename=filename, folder=folder)
+    return _write_latex_table_to_file(text=wilcoxon_table, filename=filename, folder=folder)
 
 
 def write_wilcoxon_computer_time(df):
@@ -492,23 +565,23 @@ def write_wilcoxon_computer_time(df):
     Writes a Wilcoxon table for each pair of website looking at the time spent on computer.
 
     Args:
-        df (pd.DataFrame): The dataframe with the results. Get with `src.utils.get_all_data()`
+        df (pd.DataFrame or None): The dataframe with the results. Get with `src.utils.get_all_data()`. If None,
+            renders the results from the results store, see `src.results_store.load_or_compute_results()`.
+
+    Returns:
+        Path: The path to the written table.
     """
     caption = WILCOXON_COMPUTER_TIME_CAPTION.replace("\n", " ")
     label = "tab:wilcoxon_computer_times"
     filename = "wilcoxon_computer_time.txt"
     folder = WEBISTE_TESTS_FOLDER
-    results = run_pairwise_wilcoxon_tests(
-        df,
-        test_variable="time",
-        device="computer"
-    )
+    results = load_or_compute_results("wilcoxon", get_all_wilcoxon_test_results, df)["time"]["computer"]
     wilcoxon_table = make_wilcoxon_latex_table(
         results,
         caption=caption,
         label=label,
     )
-    _write_latex_table_to_file(text=wilcoxon_table, filename=filename, folder=folder)
+    return _write_latex_table_to_file(text=wilcoxon_table, filename=filename, folder=folder)
 
 
 def write_wilcoxon_phone_time(df):
@@ -516,24 +589,24 @@ def write_wilcoxon_phone_time(df):
     Writes a Wilcoxon table for each pair of website looking at the time spent on phone.
 
     Args:
-        df (pd.DataFrame): The dataframe with the results. Get with `src.utils.get_all_data()`
+        df (pd.DataFrame or None): The dataframe with the results. Get with `src.utils.get_all_data()`. If None,
+            renders the results from the results store, see `src.results_store.load_or_compute_results()`.
+
+    Returns:
+        Path: The path to the written table.
     """
     make_wilcoxon_latex_table
     caption = WILCOXON_PHONE_TIME_CAPTION.replace("\n", " ")
     label = "tab:wilcoxon_phone_times"
     filename = "wilcoxon_phone_time.txt"
     folder = WEBISTE_TESTS_FOLDER
-    results = run_pairwise_wilcoxon_tests(
-        df,
-        test_variable="time",
-        device="phone"
-    )
+    results = load_or_compute_results("wilcoxon", get_all_wilcoxon_test_results, df)["time"]["phone"]
     wilcoxon_table = make_wilcoxon_latex_table(
         results,
         caption=caption,
         label=label,
     )
-    _write_latex_table_to_file(text=wilcoxon_table, filename=filename, folder=folder)
+    return _write_latex_table_to_file(text=wilcoxon_table, filename=filename, folder=folder)
 
 
 def write_withdrawal_statistics_table(df):
@@ -541,28 +614,109 @@ def write_withdrawal_statistics_table(df):
     Writes the table with average response and withdrawal times.
 
     Args:
-        df (pd.DataFrame): The dataframe with the results. Get with `src.utils.get_all_data()`
+        df (pd.DataFrame or None): The dataframe with the results. Get with `src.utils.get_all_data()`. If None,
+            renders the results from the results store, see `src.results_store.load_or_compute_results()`.
+
+    Returns:
+        Path: The path to the written table.
     """
     caption = WITHDRAWAL_STATISTICS_CAPTION.replace("\n", " ")
     label = "tab:withdrawal_statistics"
     filename = "withdrawal_statistics.txt"
     folder = WEBISTE_TESTS_FOLDER
-    results = get_withdrawal_and_answer_times(df)
+    results = load_or_compute_results("withdrawal_statistics", get_withdrawal_and_answer_times, df)
     withdrawal_table = make_withdrawal_statistics_latex_table(
         results_dict=results,
         caption=caption,
         label=label,
     )
-    _write_latex_table_to_file(text=withdrawal_table, filename=filename, folder=folder)
+    return _write_latex_table_to_file(text=withdrawal_table, filename=filename, folder=folder)
+
+
+# The functions writing each family of tables, in the order they are written
+TABLE_FAMILIES = {
+    "nettskjema_report": [write_nettskjema_report],
+    "shapiro_wilk": [write_shapiro_wilk_main, write_shapiro_wilk_extra_accepts, write_shapiro_wilk_extra_time],
+    "mean_and_sd": [write_mean_sd_main, write_mean_sd_extra_accepts, write_mean_sd_extra_time],
+    "bootstrap": [write_bootstrap_main, write_bootstrap_extra_accepts, write_bootstrap_extra_time],
+    "website_statistics": [
+        write_website_statistics_accepts, write_website_statistics_time, write_website_tests_accepts,
+        write_website_tests_time,
+    ],
+    "friedman": [write_friedman],
+    "wilcoxon": [
+        write_wilcoxon_total_accepts, write_wilcoxon_computer_accepts, write_wilcoxon_phone_accepts,
+        write_wilcoxon_total_time, write_wilcoxon_computer_time, write_wilcoxon_phone_time,
+    ],
+    "withdrawal": [write_withdrawal_statistics_table],
+}
+
+
+def _init_table_worker(df):
+    """
+    Initializes a worker process writing tables. The dataframe is sent once per worker, instead of once per task. With
+    the "fork" start method (the default on Linux), it is inherited from the main process without being copied.
+    """
+    global _WORKER_DF
+    _WORKER_DF = df
+    # The families are already spread over the workers, so the tests in them should not start more processes
+    override_constants({**get_constant_overrides(), "n_workers": 1})
+
+
+def _write_group_in_worker(write_functions):
+    """
+    Writes one group of outputs in a worker process, with the dataframe from `_init_table_worker()`.
+
+    Args:
+        write_functions (list of callable): The functions writing the outputs, called as `function(df)`.
+
+    Returns:
+        list of Path: The paths written, in the same order as `write_functions`.
+    """
+    return [write_function(_WORKER_DF) for write_function in write_functions]
+
+
+def write_groups_in_parallel(df, groups, n_workers=None):
+    """
+    Writes groups of tables (or plots), with one group per task on a pool of worker processes. The groups should be
+    independent, like the families in `TABLE_FAMILIES`, which only share the read-only dataframe and store their
+    results under different names. The tables in a group are written one after another in the same process, so they
+    can share the memoized results.
+
+    Args:
+        df (pd.DataFrame or None): The dataframe with the data, passed to every function.
+        groups (list of list of callable): The groups of functions writing the outputs. They are called as
+            `function(df)`, must return the path they wrote, and must be defined at module level so they can be sent
+            to the workers.
+        n_workers (int or None): The number of worker processes, where 0 means all cores. If None, uses
+            `CONSTANTS["n_table_workers"]`, where 0 or None (null in the yaml file) means all cores. With one worker,
+            the groups are written in this process.
+
+    Yields:
+        list of Path: The paths written by each group, in the same order as `groups`.
+    """
+    n_workers = min(get_n_workers(n_workers, constant_name="n_table_workers"), len(groups))
+    if n_workers <= 1:
+        for write_functions in groups:
+            yield [write_function(df) for write_function in write_functions]
+        return
+
+    with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_table_worker, initargs=(df,)) as executor:
+        yield from executor.map(_write_group_in_worker, groups)
 
 
 def write_all_latex_tables(df, nettskjema_report=False, shapiro_wilk=False, mean_and_sd=False, bootstrap=False,
-                           website_statistics=False, friedman=False, wilcoxon=False, withdrawal=False):
+                           website_statistics=False, friedman=False, wilcoxon=False, withdrawal=False, n_workers=None):
     """
-    Writes the LaTeX tables, depending on the arguments passed. Calls all of the other functions to do so.
+    Writes the LaTeX tables, depending on the arguments passed. Calls all of the other functions to do so. All the
+    chosen tables are written, see `src.pipeline.run_pipeline()` for only writing the tables that are out of date.
+
+    The families of tables are independent, and are written in parallel when there are more than one worker, see
+    `write_groups_in_parallel()`.
 
     Args:
-        df (pd.DataFrame): The dataframe with the results. Get with `src.utils.get_all_data()`
+        df (pd.DataFrame or None): The dataframe with the results. Get with `src.utils.get_all_data()`. If None, the
+            tables are rendered from the results store. The nettskjema report needs the data and can not be written.
         nettskjema_report (bool): Whether or not to write the nettskjema report.
         shapiro_wilk (bool): Whether or not to write the three Shapiro-Wilk normality tables.
         mean_and_sd (bool): Whether or not to write the three mean and standard deviation tables.
@@ -571,34 +725,23 @@ def write_all_latex_tables(df, nettskjema_report=False, shapiro_wilk=False, mean
         friedman (bool): Whether or not to print the friedman table.
         wilcoxon (bool): Whether or not to print the six Wilcoxon tables.
         withdrawal (bool): Whether or not to print the average response and withdrawal time table.
-    """
-    if nettskjema_report:
-        write_nettskjema_report(df)
-    if shapiro_wilk:
-        write_shapiro_wilk_main(df)
-        write_shapiro_wilk_extra_accepts(df)
-        write_shapiro_wilk_extra_time(df)
-    if mean_and_sd:
-        write_mean_sd_main(df)
-        write_mean_sd_extra_accepts(df)
-        write_mean_sd_extra_time(df)
-    if bootstrap:
-        write_bootstrap_main(df)
-        write_bootstrap_extra_accepts(df)
-        write_bootstrap_extra_time(df)
-    if website_statistics:
-        write_website_statistics_accepts(df)
-        write_website_statistics_time(df)
-        write_website_tests_accepts(df)
-        write_website_tests_time(df)
-    if friedman:
-        write_friedman(df)
-    if wilcoxon:
-        write_wilcoxon_total_accepts(df)
-        write_wilcoxon_computer_accepts(df)
-        write_wilcoxon_phone_accepts(df)
-        write_wilcoxon_total_time(df)
-        write_wilcoxon_computer_time(df)
-        write_wilcoxon_phone_time(df)
-    if withdrawal:
-        write_withdrawal_statistics_table(df)
+        n_workers (int or None): Worker processes for the families. If None, uses `CONSTANTS["n_table_workers"]`.
+
+    Returns:
+        list of Path: The paths to the written tables.
+    """
+    chosen_families = {
+        "nettskjema_report": nettskjema_report,
+        "shapiro_wilk": shapiro_wilk,
+        "mean_and_sd": mean_and_sd,
+        "bootstrap": bootstrap,
+        "website_statistics": website_statistics,
+        "friedman": friedman,
+        "wilcoxon": wilcoxon,
+        "withdrawal": withdrawal,
+    }
+    groups = [write_functions for family, write_functions in TABLE_FAMILIES.items() if chosen_families[family]]
+    file_paths = []
+    for group_file_paths in write_groups_in_parallel(df, groups, n_workers=n_workers):
+        file_paths += group_file_paths
+    return file_paths